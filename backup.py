@@ -0,0 +1,131 @@
+import asyncio
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+# فاصلهٔ تلاش دوباره پس از پشتیبان‌گیری ناموفق
+RETRY_S = 300.0
+
+
+def snapshot_name(db_path: str, when: datetime) -> str:
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return f"{stem}-{when:%Y%m%d-%H%M%S}.db.gz"
+
+
+def snapshot_time(path: str) -> float:
+    """زمان گرفتن نسخه (epoch) از روی نام فایل که به وقت UTC است."""
+    stamp = os.path.basename(path)[-len("YYYYmmdd-HHMMSS.db.gz"):-len(".db.gz")]
+    return datetime.strptime(stamp, "%Y%m%d-%H%M%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+def list_snapshots(db_path: str, dest_dir: str) -> List[str]:
+    """نسخه‌های موجود همین دیتابیس، از قدیمی به جدید."""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    pattern = re.compile(re.escape(stem) + r"-\d{8}-\d{6}\.db\.gz")
+    try:
+        names = os.listdir(dest_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(dest_dir, n) for n in names if pattern.fullmatch(n))
+
+
+def snapshot(db_path: str, dest_dir: str, keep: int = 7, pages: int = 1024, step_sleep: float = 0.01,
+             connect: Callable[[str], sqlite3.Connection] = sqlite3.connect) -> str:
+    """
+    با API پشتیبان‌گیری آنلاین SQLite در گام‌های pages صفحه‌ای یک کپی
+    سازگار از دیتابیس می‌گیرد، آن را gzip می‌کند و فقط keep نسخهٔ آخر را
+    نگه می‌دارد. بین گام‌ها قفل خواندن آزاد می‌شود تا ربات کارش را ادامه
+    دهد؛ بنابراین باید در thread جدا اجرا شود. مسیر فایل جدید را برمی‌گرداند.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    final = os.path.join(dest_dir, snapshot_name(db_path, datetime.utcnow()))
+    raw = final[:-len(".gz")] + ".part"
+    packed = final + ".part"
+    try:
+        with closing(connect(db_path)) as src, closing(sqlite3.connect(raw)) as dst:
+            src.backup(dst, pages=pages, sleep=step_sleep)
+        with open(raw, "rb") as fin, gzip.open(packed, "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        os.replace(packed, final)
+    finally:
+        for leftover in (raw, packed):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    for old in list_snapshots(db_path, dest_dir)[:-keep] if keep > 0 else []:
+        os.remove(old)
+    return final
+
+
+class BackupRunner:
+    """
+    پشتیبان‌گیری یک دیتابیس: هر interval_s یک نسخه در پس‌زمینه و backup()
+    برای درخواست دستی. موعد بعدی از جدیدترین نسخهٔ روی دیسک حساب می‌شود، پس
+    ری‌استارت‌های پشت سر هم زمان‌بندی را عقب نمی‌اندازند. دو پشتیبان‌گیری
+    هم‌زمان روی یک دیتابیس اجرا نمی‌شود.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        dest_dir: str,
+        keep: int = 7,
+        interval_s: float = 24 * 3600,
+        pages: int = 1024,
+        step_sleep: float = 0.01,
+        connect: Callable[[str], sqlite3.Connection] = sqlite3.connect,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db_path = db_path
+        self.dest_dir = dest_dir
+        self.keep = keep
+        self.interval_s = interval_s
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self._connect = connect
+        self._clock = clock
+        self.last_path: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def backup(self) -> str:
+        async with self._lock:
+            started = time.monotonic()
+            path = await asyncio.to_thread(
+                snapshot, self.db_path, self.dest_dir, self.keep, self.pages, self.step_sleep, self._connect
+            )
+            self.last_path = path
+            self.last_duration = time.monotonic() - started
+        log.info("backup of %s written to %s in %.1fs", self.db_path, path, self.last_duration)
+        return path
+
+    def next_run(self) -> float:
+        """موعد نسخهٔ بعدی (epoch)؛ اگر نسخه‌ای نیست، همین حالا."""
+        snapshots = list_snapshots(self.db_path, self.dest_dir)
+        if not snapshots:
+            return self._clock()
+        return snapshot_time(snapshots[-1]) + self.interval_s
+
+    async def run(self) -> None:
+        if self.interval_s <= 0:
+            return
+        while True:
+            delay = self.next_run() - self._clock()
+            if delay > 0:
+                # بعد از خواب دوباره حساب می‌شود؛ /backup دستی موعد را جلو می‌برد
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await self.backup()
+            except Exception:
+                log.exception("scheduled backup of %s failed", self.db_path)
+                await asyncio.sleep(min(self.interval_s, RETRY_S))
@@ -0,0 +1,81 @@
+"""
+زمان راه‌اندازی سرد: از شروع پروسه تا پایان پردازش اولین آپدیت.
+
+هر تکرار یک پروسهٔ پایتون تازه اجرا می‌کند که bot.py را import می‌کند،
+init_db را روی یک دیتابیس موقت اجرا می‌کند، Dispatcher را با RecordingBot
+می‌سازد و یک آپدیت /start را پردازش می‌کند.
+
+    python benchmarks/bench_startup.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {here!r})
+t_start = time.monotonic()
+import stubs
+import asyncio
+import bot
+t_import = time.monotonic()
+bot.init_db()
+t_db = time.monotonic()
+
+async def run():
+    b = stubs.RecordingBot()
+    dp = bot.build_dispatcher(b)
+    bot.Bot.set_current(b)
+    bot.Dispatcher.set_current(dp)
+    t_built = time.monotonic()
+    await dp.process_updates([stubs.make_update(1, "/start")])
+    return t_built, time.monotonic()
+
+t_built, t_first = asyncio.run(run())
+print(json.dumps({{"start": t_start, "import": t_import, "init_db": t_db, "built": t_built, "first_update": t_first}}))
+"""
+
+
+def run_once(db_dir: str) -> dict:
+    env = dict(os.environ, DB_PATH=os.path.join(db_dir, "bot.db"))
+    t0 = time.monotonic()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(here=HERE)],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    marks = json.loads(out.strip().splitlines()[-1])
+    return {
+        "interpreter": marks["start"] - t0,
+        "imports": marks["import"] - marks["start"],
+        "init_db": marks["init_db"] - marks["import"],
+        "build": marks["built"] - marks["init_db"],
+        "first_update": marks["first_update"] - marks["built"],
+        "total": marks["first_update"] - t0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as d:
+            results.append(run_once(d))
+
+    print(f"runs: {args.runs}")
+    for key in ("interpreter", "imports", "init_db", "build", "first_update", "total"):
+        vals = [r[key] * 1000 for r in results]
+        print(f"{key:>13}: median {statistics.median(vals):7.1f} ms   min {min(vals):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+توان عملیاتی انتها-به-انتهای bot.py با آپدیت‌های مصنوعی.
+
+آپدیت‌ها مستقیم به dp.process_updates داده می‌شوند؛ Bot با RecordingBot
+جایگزین شده، دیتابیس در یک پوشهٔ موقت ساخته می‌شود و پنل مرزبان یک سرور
+aiohttp محلی است. برای هر سناریو (renew، credit، admin) نرخ آپدیت در ثانیه،
+صدک‌های تأخیر هندلر و تعداد تماس‌های DB/HTTP/تلگرام به ازای هر آپدیت گزارش می‌شود.
+
+    python benchmarks/bench_throughput.py [--users 50] [--rounds 20] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import closing
+
+import stubs  # noqa: F401  (محیط را برای import شدن bot.py آماده می‌کند)
+from aiohttp import web
+
+import bot
+from renew_service import MarzbanRenewService
+
+SUPERADMIN_ID = 1
+ADMIN_BASE = 1_000
+CUSTOMER_BASE = 10_000
+
+
+class Counters:
+    def __init__(self):
+        self.db_connects = 0
+        self.db_statements = 0
+        self.http = 0
+
+    def snapshot(self):
+        return self.db_connects, self.db_statements, self.http
+
+
+COUNTERS = Counters()
+_real_connect = sqlite3.connect
+
+
+def _counting_connect(*args, **kwargs):
+    conn = _real_connect(*args, **kwargs)
+    COUNTERS.db_connects += 1
+
+    def trace(_sql):
+        COUNTERS.db_statements += 1
+
+    conn.set_trace_callback(trace)
+    return conn
+
+
+async def start_fake_panel():
+    async def token(request):
+        COUNTERS.http += 1
+        return web.json_response({"access_token": "bench"})
+
+    async def get_user(request):
+        COUNTERS.http += 1
+        name = request.match_info["name"]
+        return web.json_response({"username": name, "status": "active", "expire": 0, "proxies": {}, "links": []})
+
+    async def put_user(request):
+        COUNTERS.http += 1
+        body = await request.json()
+        return web.json_response({"username": request.match_info["name"], **body})
+
+    async def reset(request):
+        COUNTERS.http += 1
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post("/api/admin/token", token)
+    app.router.add_get("/api/user/{name}", get_user)
+    app.router.add_put("/api/user/{name}", put_user)
+    app.router.add_post("/api/user/{name}/reset", reset)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def scenario_updates(name: str, lane: int, idx: int):
+    """دنبالهٔ پیام‌های یک کاربر در هر دور از سناریو."""
+    tid = CUSTOMER_BASE + idx
+    if name == "renew":
+        return tid, ["🔁 تمدید کاربر", f"user{idx}"]
+    if name == "credit":
+        return tid, ["💳 اعتبار من"]
+    if name == "admin":
+        return ADMIN_BASE + lane, ["🔎 اعتبار مشتری", str(tid)]
+    raise ValueError(name)
+
+
+async def run_scenario(dp, tg_bot, name: str, users: int, admins: int, rounds: int, concurrency: int):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+    # هر lane یک chat است و مراحل FSM آن پشت سر هم اجرا می‌شوند
+    lanes = admins if name == "admin" else users
+
+    async def lane(i: int):
+        for r in range(rounds):
+            tid, texts = scenario_updates(name, i, (i + r * lanes) % users)
+            for text in texts:
+                async with sem:
+                    t = time.perf_counter()
+                    await dp.process_updates([stubs.make_update(tid, text)])
+                    latencies.append(time.perf_counter() - t)
+
+    calls_before = len(tg_bot.calls)
+    db_c0, db_s0, http0 = COUNTERS.snapshot()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(lane(i) for i in range(lanes)))
+    wall = time.perf_counter() - t0
+    db_c1, db_s1, http1 = COUNTERS.snapshot()
+
+    n = len(latencies)
+    q = statistics.quantiles(latencies, n=100, method="inclusive") if n > 1 else latencies * 99
+    print(f"[{name}] updates={n}  {n / wall:8.1f} upd/s")
+    print(f"    latency ms  p50={q[49] * 1000:7.2f}  p90={q[89] * 1000:7.2f}  p99={q[98] * 1000:7.2f}  max={max(latencies) * 1000:7.2f}")
+    print(f"    per update  db_connects={(db_c1 - db_c0) / n:5.2f}  db_statements={(db_s1 - db_s0) / n:5.2f}"
+          f"  panel_http={(http1 - http0) / n:5.2f}  telegram_calls={(len(tg_bot.calls) - calls_before) / n:5.2f}")
+
+
+async def main_async(args):
+    runner, panel_url = await start_fake_panel()
+    tg_bot = stubs.RecordingBot()
+    bot.Bot.set_current(tg_bot)
+    dp = bot.build_dispatcher(tg_bot)
+    bot.Dispatcher.set_current(dp)
+    bot._svc = MarzbanRenewService(panel_url, "admin", "pass")
+    try:
+        for name in args.scenarios:
+            await run_scenario(dp, tg_bot, name, args.users, args.admins, args.rounds, args.concurrency)
+    finally:
+        await bot._svc.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--admins", type=int, default=5, help="ادمین‌های ثبت‌شده؛ گیرندگان notify_admins")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", nargs="+", default=["renew", "credit", "admin"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        bot.DB_PATH = os.path.join(d, "bot.db")
+        bot.SUPERADMINS = {SUPERADMIN_ID}
+        bot.init_db()
+        with closing(_real_connect(bot.DB_PATH)) as conn, conn:
+            conn.executemany(
+                "INSERT INTO customers (telegram_id, credits, username, full_name) VALUES (?, ?, ?, ?)",
+                [(CUSTOMER_BASE + i, 1_000_000, f"u{CUSTOMER_BASE + i}", "Bench") for i in range(args.users)],
+            )
+            conn.executemany(
+                "INSERT INTO admins (telegram_id, username, full_name) VALUES (?, ?, ?)",
+                [(ADMIN_BASE + i, f"a{i}", "Bench") for i in range(args.admins)],
+            )
+        sqlite3.connect = _counting_connect
+        try:
+            asyncio.run(main_async(args))
+        finally:
+            sqlite3.connect = _real_connect
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+ابزارهای مشترک بنچمارک‌ها: Bot ساختگی که به‌جای تماس با تلگرام درخواست‌ها را
+ثبت می‌کند، و ساخت آپدیت‌های مصنوعی.
+"""
+import itertools
+import os
+import sys
+import time
+
+# bot.py تنظیماتش را هنگام import از محیط می‌خواند
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("SUPERADMIN_IDS", "1")
+os.environ.setdefault("MARZBAN_ADDRESS", "http://127.0.0.1:1")
+os.environ.setdefault("MARZBAN_USERNAME", "admin")
+os.environ.setdefault("MARZBAN_PASSWORD", "pass")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, types  # noqa: E402
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+class RecordingBot(Bot):
+    """Bot که هر فراخوانی API را در calls نگه می‌دارد و پاسخ ساختگی برمی‌گرداند."""
+
+    def __init__(self, token: str = os.environ["TELEGRAM_TOKEN"], **kwargs):
+        super().__init__(token, **kwargs)
+        self.calls = []
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        self.calls.append((method, data))
+        chat_id = int((data or {}).get("chat_id") or 0)
+        if method in ("sendMessage", "sendDocument"):
+            return {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": (data or {}).get("text", ""),
+            }
+        if method == "getChat":
+            return {"id": chat_id, "type": "private", "username": f"user{chat_id}", "first_name": "Bench"}
+        return True
+
+
+def make_update(user_id: int, text: str) -> types.Update:
+    return types.Update.to_object({
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"u{user_id}"},
+            "text": text,
+        },
+    })
@@ -1,22 +1,38 @@
 # -*- coding: utf-8 -*-
 # telegram.py  (aiogram 2.x)
 
+import time
+_IMPORT_T0 = time.perf_counter()  # مبدأ اندازه‌گیری زمان راه‌اندازی
+
 import os
+import csv
+import gzip
 import asyncio
 import logging
+import re
 import sqlite3
-from contextlib import closing
-from datetime import datetime
+import tempfile
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
 
-import pytz
-import jdatetime               # pip install jdatetime
-from aiogram import Bot, Dispatcher, executor, types  # pip install aiogram==2.25.2
+# pytz و jdatetime فقط برای گزارش‌ها لازم‌اند و در jalali_now_str به‌صورت lazy ایمپورت می‌شوند
+from aiogram import Bot, Dispatcher, types  # pip install aiogram==2.25.2
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 
+import aiohttp
+
+from backup import BackupRunner
+from checkpoint import WalCheckpointer
+from jsonlog import current_correlation_id, setup_logging, traced
+from limiter import AdaptiveLimiter
+from outbox import BROADCAST, INTERACTIVE, SendScheduler, send_priority
 from renew_service import MarzbanRenewService
+from scheduler import RenewScheduler
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file if present
@@ -41,19 +57,116 @@ MARZBAN_USERNAME = os.getenv("MARZBAN_USERNAME")
 MARZBAN_PASSWORD = os.getenv("MARZBAN_PASSWORD")
 if not all([MARZBAN_ADDRESS, MARZBAN_USERNAME, MARZBAN_PASSWORD]):
     raise RuntimeError("Marzban credentials are not fully set in the environment")
+# سقف پنجرهٔ هم‌زمانی تطبیقی درخواست‌ها به پنل
+PANEL_MAX_CONCURRENCY = int(os.getenv("PANEL_MAX_CONCURRENCY", "32"))
 
 # وضعیت فعال بودن ربات (on/off)
 BOT_STATUS = os.getenv("BOT_STATUS", "on").lower() in ("on", "1", "true")
 
-IR_TZ = pytz.timezone("Asia/Tehran")
-DB_PATH = "/var/lib/marzban/renew-tg-bot/bot.db"
+# تمدید خودکار: چند دقیقه قبل از انقضا، اندازهٔ دسته و حداکثر تمدید هم‌زمان
+AUTO_RENEW_LEAD_S = int(os.getenv("AUTO_RENEW_LEAD_MINUTES", "60")) * 60
+AUTO_RENEW_BATCH = int(os.getenv("AUTO_RENEW_BATCH", "100"))
+AUTO_RENEW_CONCURRENCY = int(os.getenv("AUTO_RENEW_CONCURRENCY", "8"))
+AUTO_RENEW_RETRY_S = 15 * 60
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+IR_TZ_NAME = "Asia/Tehran"
+DB_PATH = os.getenv("DB_PATH", "/var/lib/marzban/renew-tg-bot/bot.db")
+
+# پشتیبان‌گیری: بیرون از پوشهٔ دیتابیس تا با uninstall پاک نشود
+BACKUP_DIR = os.getenv("BACKUP_DIR", "/var/backups/renew-tg-bot")
+BACKUP_INTERVAL_S = float(os.getenv("BACKUP_INTERVAL_HOURS", "24")) * 3600
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+# سقف حجم فایل ارسالی Bot API
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+# ---------------- چند برند در یک پروسه ----------------
+# TENANT_BOTS=brand_a=<token>,brand_b=<token>
+# هر برند ربات تلگرام خودش و فایل دیتابیس جدای خودش (bot-<name>.db کنار DB_PATH)
+# را دارد؛ سرویس مرزبان و اتصال‌های HTTP بین همه مشترک است.
+_TENANT_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def _tenants_from_env(key: str):
+    raw = os.getenv(key, "").strip()
+    tenants = {}
+    for item in raw.split(","):
+        name, sep, token = item.strip().partition("=")
+        if not sep:
+            continue
+        name, token = name.strip(), token.strip()
+        if not _TENANT_NAME_RE.match(name) or not token:
+            raise RuntimeError(f"Invalid {key} entry: {item.strip()!r}")
+        tenants[name] = token
+    return tenants
+
+TENANT_BOTS = _tenants_from_env("TENANT_BOTS")
+
+def tenant_db_path(name: str) -> str:
+    return os.path.join(os.path.dirname(DB_PATH), f"bot-{name}.db")
+
+_current_db: ContextVar[str | None] = ContextVar("current_db", default=None)
+
+def db_path() -> str:
+    """مسیر دیتابیس برند جاری (یا DB_PATH برای ربات اصلی)."""
+    return _current_db.get() or DB_PATH
+
+@contextmanager
+def use_db(path: str):
+    token = _current_db.set(path)
+    try:
+        yield
+    finally:
+        _current_db.reset(token)
+
+# ---------------- اتصال SQLite ----------------
+# synchronous، cache_size و mmap_size تنظیم هر اتصال‌اند نه فایل دیتابیس، پس
+# همهٔ اتصال‌ها از connect() ساخته می‌شوند. SQLITE_PRAGMAS مقادیر را عوض یا اضافه می‌کند:
+# SQLITE_PRAGMAS=synchronous=FULL,cache_size=-32000
+DEFAULT_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "busy_timeout": "5000",
+    "cache_size": "-8000",          # KiB
+    "mmap_size": "134217728",
+    "temp_store": "MEMORY",
+    # checkpoint اصلی با WalCheckpointer است؛ این فقط سقف اضطراری WAL است
+    "wal_autocheckpoint": "10000",
+}
+_PRAGMA_NAME_RE = re.compile(r"^[a-z_]+$")
+_PRAGMA_VALUE_RE = re.compile(r"^-?\w+$")
+
+def _pragmas_from_env(key: str):
+    pragmas = dict(DEFAULT_PRAGMAS)
+    raw = os.getenv(key, "").strip()
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        name, sep, value = item.strip().partition("=")
+        name, value = name.strip().lower(), value.strip()
+        # PRAGMA پارامتر نمی‌پذیرد؛ فقط نام و مقدار ساده مجاز است
+        if not sep or not _PRAGMA_NAME_RE.match(name) or not _PRAGMA_VALUE_RE.match(value):
+            raise RuntimeError(f"Invalid {key} entry: {item.strip()!r}")
+        pragmas[name] = value
+    return pragmas
+
+SQLITE_PRAGMAS = _pragmas_from_env("SQLITE_PRAGMAS")
+
+# checkpoint پس‌زمینهٔ WAL: PASSIVE هر بازه، TRUNCATE وقتی WAL مدتی بی‌تغییر بماند
+WAL_CHECKPOINT_INTERVAL_S = float(os.getenv("WAL_CHECKPOINT_INTERVAL_S", "60"))
+WAL_TRUNCATE_IDLE_S = float(os.getenv("WAL_TRUNCATE_IDLE_S", "300"))
+
+def connect(path: str | None = None, **kwargs) -> sqlite3.Connection:
+    """اتصال به دیتابیس برند جاری (یا path) با پروفایل SQLITE_PRAGMAS."""
+    conn = sqlite3.connect(path or db_path(), **kwargs)
+    conn.executescript("".join(f"PRAGMA {name}={value};" for name, value in SQLITE_PRAGMAS.items()))
+    return conn
 
 # ---------------- نقش‌ها ----------------
 def is_superadmin(tid: int) -> bool:
     return tid in SUPERADMINS or (len(SUPERADMINS) == 0)
 
 def is_admin_db(tid: int) -> bool:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with closing(connect()) as conn:
         row = conn.execute("SELECT 1 FROM admins WHERE telegram_id=?", (tid,)).fetchone()
         return row is not None
 
@@ -61,17 +174,17 @@ def is_admin(tid: int) -> bool:
     return is_superadmin(tid) or is_admin_db(tid)
 
 def is_customer(tid: int) -> bool:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with closing(connect()) as conn:
         row = conn.execute("SELECT 1 FROM customers WHERE telegram_id=?", (tid,)).fetchone()
         return row is not None
 
 # ---------------- دیتابیس ----------------
 def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
+    os.makedirs(os.path.dirname(db_path()), exist_ok=True)
+    with closing(connect()) as conn, conn:
         c = conn.cursor()
+        # journal_mode در خود فایل ذخیره می‌شود؛ بقیهٔ pragmaها را connect() می‌گذارد
         c.execute("PRAGMA journal_mode=WAL;")
-        c.execute("PRAGMA synchronous=NORMAL;")
 
         c.execute("CREATE TABLE IF NOT EXISTS admins (telegram_id INTEGER PRIMARY KEY)")
         c.execute(
@@ -88,6 +201,59 @@ def init_db():
             message TEXT
         )"""
         )
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            marzban_username TEXT NOT NULL,
+            next_due INTEGER NOT NULL,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            last_error TEXT,
+            UNIQUE (telegram_id, marzban_username)
+        )"""
+        )
+        # دفتر اعتبار: فقط افزودنی؛ customers.credits مانده‌ی لحظه‌ای همین دفتر است
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS credit_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts_utc TEXT NOT NULL,
+            telegram_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            balance_after INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            actor_id INTEGER,
+            log_id INTEGER
+        )"""
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS idx_ledger_customer_ts ON credit_ledger (telegram_id, ts_utc)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_ledger_ts ON credit_ledger (ts_utc)")
+        # فقط log_id (یک بار، از NULL) قابل تنظیم است؛ حذف و ویرایش ممنوع
+        c.execute(
+            """CREATE TRIGGER IF NOT EXISTS credit_ledger_no_delete BEFORE DELETE ON credit_ledger
+            BEGIN SELECT RAISE(ABORT, 'credit_ledger is append-only'); END"""
+        )
+        c.execute(
+            """CREATE TRIGGER IF NOT EXISTS credit_ledger_no_update
+            BEFORE UPDATE OF id, ts_utc, telegram_id, delta, balance_after, reason, actor_id ON credit_ledger
+            BEGIN SELECT RAISE(ABORT, 'credit_ledger is append-only'); END"""
+        )
+        c.execute(
+            """CREATE TRIGGER IF NOT EXISTS credit_ledger_log_once
+            BEFORE UPDATE OF log_id ON credit_ledger WHEN OLD.log_id IS NOT NULL
+            BEGIN SELECT RAISE(ABORT, 'credit_ledger is append-only'); END"""
+        )
+        # مهاجرت: مانده‌های قبلی به‌عنوان سطر افتتاحیه (فقط وقتی دفتر خالی است)
+        c.execute(
+            """INSERT INTO credit_ledger (ts_utc, telegram_id, delta, balance_after, reason)
+            SELECT ?, telegram_id, credits, credits, 'opening' FROM customers
+            WHERE credits != 0 AND NOT EXISTS (SELECT 1 FROM credit_ledger)""",
+            (datetime.utcnow().isoformat(),)
+        )
+        # زمان‌بند هنگام شروع فقط همین ایندکس را می‌خواند (covering index)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_due ON subscriptions (enabled, next_due)")
+        # ایندکس‌ها برای فیلتر بازهٔ زمانی و ادمین در خروجی لاگ‌ها
+        c.execute("CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs (ts_utc)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_logs_actor_ts ON logs (actor_id, ts_utc)")
         # مهاجرت جدول admins برای افزودن username و full_name (اگر قبلاً نبوده)
         try:
             c.execute("ALTER TABLE admins ADD COLUMN username TEXT")
@@ -108,11 +274,17 @@ def init_db():
         except Exception:
             pass
 
+        # شناسهٔ همبستگی تمدید؛ همان correlation_id لاگ‌های JSON و هدر X-Request-ID پنل
+        try:
+            c.execute("ALTER TABLE logs ADD COLUMN correlation_id TEXT")
+        except Exception:
+            pass
+
         for aid in ADMINS:
             c.execute("INSERT OR IGNORE INTO admins (telegram_id) VALUES (?)", (aid,))
 
 def upsert_admin_profile(tid: int, username: str, full_name: str):
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
+    with closing(connect()) as conn, conn:
         conn.execute("""
             INSERT INTO admins (telegram_id, username, full_name)
             VALUES (?, ?, ?)
@@ -122,15 +294,15 @@ def upsert_admin_profile(tid: int, username: str, full_name: str):
         """, (tid, username or "", full_name or ""))
 
 def add_admin(tid: int):
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
+    with closing(connect()) as conn, conn:
         conn.execute("INSERT OR IGNORE INTO admins (telegram_id) VALUES (?)", (tid,))
 
 def remove_admin(tid: int):
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
+    with closing(connect()) as conn, conn:
         conn.execute("DELETE FROM admins WHERE telegram_id=?", (tid,))
 
 def ensure_customer(tid: int, username: str | None = None, full_name: str | None = None):
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
+    with closing(connect()) as conn, conn:
         conn.execute("INSERT OR IGNORE INTO customers (telegram_id, credits) VALUES (?, 0)", (tid,))
         if username is not None or full_name is not None:
             conn.execute(
@@ -138,42 +310,327 @@ def ensure_customer(tid: int, username: str | None = None, full_name: str | None
                 (username, full_name, tid),
             )
 
-def add_credits(tid: int, amount: int):
-    ensure_customer(tid)
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        conn.execute("UPDATE customers SET credits = credits + ? WHERE telegram_id=?", (amount, tid))
+def _post_credit(conn: sqlite3.Connection, tid: int, delta: int, reason: str, actor_id: int | None) -> int:
+    """
+    مانده را تغییر می‌دهد و سطر دفتر را در همان تراکنش ثبت می‌کند؛ شناسهٔ سطر دفتر را برمی‌گرداند.
+    مشتری باید از قبل وجود داشته باشد.
+    """
+    conn.execute("UPDATE customers SET credits = credits + ? WHERE telegram_id=?", (delta, tid))
+    balance = conn.execute("SELECT credits FROM customers WHERE telegram_id=?", (tid,)).fetchone()[0]
+    cur = conn.execute(
+        "INSERT INTO credit_ledger (ts_utc, telegram_id, delta, balance_after, reason, actor_id) VALUES (?,?,?,?,?,?)",
+        (datetime.utcnow().isoformat(), tid, delta, balance, reason, actor_id)
+    )
+    return cur.lastrowid
 
-def set_credits(tid: int, amount: int):
-    ensure_customer(tid)
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        conn.execute("UPDATE customers SET credits = ? WHERE telegram_id=?", (amount, tid))
+def add_credits(tid: int, amount: int, reason: str = "add", actor_id: int | None = None):
+    with closing(connect()) as conn, conn:
+        conn.execute("INSERT OR IGNORE INTO customers (telegram_id, credits) VALUES (?, 0)", (tid,))
+        if amount:
+            _post_credit(conn, tid, amount, reason, actor_id)
 
-def remove_customer(tid: int):
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
+def set_credits(tid: int, amount: int, reason: str = "set", actor_id: int | None = None):
+    with closing(connect()) as conn, conn:
+        conn.execute("INSERT OR IGNORE INTO customers (telegram_id, credits) VALUES (?, 0)", (tid,))
+        current = conn.execute("SELECT credits FROM customers WHERE telegram_id=?", (tid,)).fetchone()[0]
+        if amount != current:
+            _post_credit(conn, tid, amount - current, reason, actor_id)
+
+def remove_customer(tid: int, actor_id: int | None = None):
+    with closing(connect()) as conn, conn:
+        row = conn.execute("SELECT credits FROM customers WHERE telegram_id=?", (tid,)).fetchone()
+        if row and row[0]:
+            # مانده صفر می‌شود تا جمع دفتر با مانده یکی بماند
+            _post_credit(conn, tid, -row[0], "remove", actor_id)
         conn.execute("DELETE FROM customers WHERE telegram_id=?", (tid,))
 
 def get_credits(tid: int) -> int:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with closing(connect()) as conn:
         row = conn.execute("SELECT credits FROM customers WHERE telegram_id=?", (tid,)).fetchone()
         return int(row[0]) if row else 0
 
-def dec_credit(tid: int) -> bool:
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
+def dec_credit(tid: int, reason: str = "renew", actor_id: int | None = None) -> int | None:
+    """یک واحد کم می‌کند؛ شناسهٔ سطر دفتر یا None اگر اعتبار نبود."""
+    with closing(connect()) as conn, conn:
         row = conn.execute("SELECT credits FROM customers WHERE telegram_id=?", (tid,)).fetchone()
         if not row or int(row[0]) <= 0:
-            return False
-        conn.execute("UPDATE customers SET credits = credits - 1 WHERE telegram_id=?", (tid,))
-        return True
-
-def log_action(actor_id: int, actor_username: str, marz_user: str, success: bool, message: str):
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        conn.execute(
-            "INSERT INTO logs (ts_utc, actor_id, actor_username, target_marzban_username, success, message) VALUES (?,?,?,?,?,?)",
-            (datetime.utcnow().isoformat(), actor_id, actor_username, marz_user, 1 if success else 0, message)
+            return None
+        return _post_credit(conn, tid, -1, reason, actor_id)
+
+def log_action(actor_id: int, actor_username: str, marz_user: str, success: bool, message: str,
+               ledger_id: int | None = None) -> int:
+    with closing(connect()) as conn, conn:
+        cur = conn.execute(
+            "INSERT INTO logs (ts_utc, actor_id, actor_username, target_marzban_username, success, message, correlation_id) VALUES (?,?,?,?,?,?,?)",
+            (datetime.utcnow().isoformat(), actor_id, actor_username, marz_user, 1 if success else 0, message,
+             current_correlation_id())
+        )
+        if ledger_id is not None:
+            conn.execute("UPDATE credit_ledger SET log_id=? WHERE id=?", (cur.lastrowid, ledger_id))
+    logging.info(
+        "renewal of %s by %s: %s", marz_user, actor_id, "ok" if success else "failed",
+        extra={"log_id": cur.lastrowid, "actor_id": actor_id, "target": marz_user,
+               "success": bool(success), "ledger_id": ledger_id},
+    )
+    return cur.lastrowid
+
+def credit_statement(tid: int, date_from: datetime | None = None, date_to: datetime | None = None,
+                     limit: int = 50):
+    """
+    گردش اعتبار یک مشتری در بازه (date_to شامل همان روز) از روی ایندکس (telegram_id, ts_utc).
+    خروجی: (opening, closing, credit_in, credit_out, count, rows) که rows حداکثر
+    limit سطر آخر بازه به‌صورت (ts_utc, delta, balance_after, reason, actor_id, log_id) است.
+    """
+    lo = date_from.isoformat() if date_from is not None else ""
+    hi = (date_to + timedelta(days=1)).isoformat() if date_to is not None else "9999"
+    with closing(connect()) as conn:
+        before = conn.execute(
+            "SELECT balance_after FROM credit_ledger WHERE telegram_id=? AND ts_utc < ? ORDER BY ts_utc DESC, id DESC LIMIT 1",
+            (tid, lo)
+        ).fetchone()
+        count, credit_in, credit_out = conn.execute(
+            """SELECT COUNT(*), COALESCE(SUM(CASE WHEN delta > 0 THEN delta END), 0),
+                      COALESCE(SUM(CASE WHEN delta < 0 THEN -delta END), 0)
+               FROM credit_ledger WHERE telegram_id=? AND ts_utc >= ? AND ts_utc < ?""",
+            (tid, lo, hi)
+        ).fetchone()
+        rows = conn.execute(
+            """SELECT ts_utc, delta, balance_after, reason, actor_id, log_id FROM credit_ledger
+               WHERE telegram_id=? AND ts_utc >= ? AND ts_utc < ? ORDER BY ts_utc DESC, id DESC LIMIT ?""",
+            (tid, lo, hi, limit)
+        ).fetchall()
+    opening = int(before[0]) if before else 0
+    closing_balance = opening + credit_in - credit_out
+    return opening, closing_balance, credit_in, credit_out, count, rows[::-1]
+
+def parse_statement_args(text: str):
+    """فرمت: <telegram_id> [from] [to] با تاریخ‌های YYYY-MM-DD"""
+    parts = (text or "").split()
+    if not 1 <= len(parts) <= 3:
+        raise ValueError("expected <telegram_id> [from] [to]")
+    tid = int(parts[0])
+    date_from, date_to, _ = parse_log_export_filters(" ".join(parts[1:]) or "-")
+    return tid, date_from, date_to
+
+# ---------------- ورود گروهی اعتبار از CSV ----------------
+CREDIT_IMPORT_MAX_BYTES = 5 * 1024 * 1024
+# تعداد telegram_id در هر IN (...) برای بررسی ماندهٔ منفی؛ زیر سقف متغیرهای SQLite
+CREDIT_IMPORT_CHECK_CHUNK = 500
+CREDIT_IMPORT_MAX_ERRORS = 10
+
+def parse_credit_csv(fh):
+    """
+    ردیف‌های telegram_id,op,amount (op: set یا add) را خط‌به‌خط می‌خواند و
+    عملیات هر مشتری را تجمیع می‌کند (set مقدار را جایگزین و add به آن اضافه می‌کند).
+    خروجی: (ops, rows, errors) که ops نگاشت telegram_id → ("set"|"add", n) است.
+    سطر عنوان (اولین سطر غیرخالی) و خطوط خالی نادیده گرفته می‌شوند. ماندهٔ
+    نهایی set منفی خطاست؛ add منفی هنگام اعمال در برابر مانده بررسی می‌شود.
+    """
+    ops: dict[int, tuple[str, int]] = {}
+    rows = 0
+    invalid = 0
+    errors = []
+    first = True
+    for lineno, row in enumerate(csv.reader(fh), start=1):
+        cells = [c.strip() for c in row]
+        if not any(cells):
+            continue
+        if first:
+            first = False
+            if not cells[0].lstrip("-").isdigit():
+                continue  # سطر عنوان
+        rows += 1
+        try:
+            tid_s, op, amt_s = cells
+            tid, amount, op = int(tid_s), int(amt_s), op.lower()
+            if tid <= 0 or op not in ("set", "add") or (op == "set" and amount < 0):
+                raise ValueError
+        except ValueError:
+            invalid += 1
+            if len(errors) < CREDIT_IMPORT_MAX_ERRORS:
+                errors.append(f"خط {lineno}: {','.join(row)}")
+            continue
+        kind, value = ops.get(tid, ("add", 0))
+        ops[tid] = ("set", amount) if op == "set" else (kind, value + amount)
+    for tid, (kind, value) in ops.items():
+        if kind == "set" and value < 0:
+            invalid += 1
+            if len(errors) < CREDIT_IMPORT_MAX_ERRORS:
+                errors.append(f"مشتری {tid}: ماندهٔ نهایی منفی ({value})")
+    if invalid > len(errors):
+        errors.append(f"... و {invalid - len(errors)} خط نامعتبر دیگر")
+    return ops, rows, errors
+
+def apply_credit_import(ops: dict[int, tuple[str, int]], actor_id: int | None = None) -> dict:
+    """
+    همهٔ تغییرات را با executemany در یک تراکنش اعمال می‌کند (مشتری‌های جدید ساخته
+    می‌شوند) و برای هر تغییر مانده سطر دفتر اعتبار با reason=import ثبت می‌کند.
+    اگر add منفی ماندهٔ مشتری‌ای را زیر صفر ببرد، تراکنش برمی‌گردد و ValueError
+    با فهرست خطاها بالا می‌رود.
+    """
+    now = datetime.utcnow().isoformat()
+    sets = [(tid, v) for tid, (kind, v) in ops.items() if kind == "set"]
+    adds = [(tid, v) for tid, (kind, v) in ops.items() if kind == "add" and v != 0]
+    with closing(connect()) as conn, conn:
+        created = conn.executemany(
+            "INSERT OR IGNORE INTO customers (telegram_id, credits) VALUES (?, 0)", [(tid,) for tid in ops]
+        ).rowcount
+        # سطر دفتر قبل از به‌روزرسانی مانده ثبت می‌شود تا delta از مقدار قبلی حساب شود
+        conn.executemany(
+            """INSERT INTO credit_ledger (ts_utc, telegram_id, delta, balance_after, reason, actor_id)
+            SELECT ?, telegram_id, ? - credits, ?, 'import', ? FROM customers WHERE telegram_id=? AND credits != ?""",
+            [(now, v, v, actor_id, tid, v) for tid, v in sets]
         )
+        changed = conn.executemany(
+            "UPDATE customers SET credits = ? WHERE telegram_id=? AND credits != ?", [(v, tid, v) for tid, v in sets]
+        ).rowcount
+        conn.executemany(
+            """INSERT INTO credit_ledger (ts_utc, telegram_id, delta, balance_after, reason, actor_id)
+            SELECT ?, telegram_id, ?, credits + ?, 'import', ? FROM customers WHERE telegram_id=?""",
+            [(now, v, v, actor_id, tid) for tid, v in adds]
+        )
+        changed += conn.executemany(
+            "UPDATE customers SET credits = credits + ? WHERE telegram_id=?", [(v, tid) for tid, v in adds]
+        ).rowcount
+        # فقط مشتری‌هایی که add منفی داشته‌اند؛ ماندهٔ منفی دیگران ربطی به این فایل ندارد
+        debited = sorted(tid for tid, v in adds if v < 0)
+        negative = []
+        for i in range(0, len(debited), CREDIT_IMPORT_CHECK_CHUNK):
+            chunk = debited[i:i + CREDIT_IMPORT_CHECK_CHUNK]
+            negative += conn.execute(
+                f"SELECT telegram_id, credits FROM customers WHERE credits < 0 AND telegram_id IN ({','.join('?' * len(chunk))}) ORDER BY telegram_id",
+                chunk
+            ).fetchall()
+            if len(negative) >= CREDIT_IMPORT_MAX_ERRORS:
+                break
+        if negative:
+            raise ValueError([f"مشتری {tid}: ماندهٔ نهایی منفی ({c})" for tid, c in negative[:CREDIT_IMPORT_MAX_ERRORS]])
+    return {"customers": len(ops), "created": created, "changed": changed}
+
+def import_credits_csv(path: str, actor_id: int | None = None):
+    """(summary, rows, errors)؛ اگر خطایی باشد هیچ تغییری اعمال نمی‌شود و summary برابر None است."""
+    with open(path, encoding="utf-8-sig", newline="") as fh:
+        ops, rows, errors = parse_credit_csv(fh)
+    if errors or not ops:
+        return None, rows, errors
+    try:
+        return apply_credit_import(ops, actor_id), rows, errors
+    except ValueError as e:
+        return None, rows, e.args[0]
+
+# ---------------- اشتراک‌های تمدید خودکار ----------------
+def subscription_due_index():
+    with closing(connect()) as conn:
+        return conn.execute("SELECT next_due, id FROM subscriptions WHERE enabled=1").fetchall()
+
+def load_subscriptions(ids: list[int]):
+    """[(id, (telegram_id, marzban_username))] برای اشتراک‌های هنوز فعال."""
+    marks = ",".join("?" * len(ids))
+    with closing(connect()) as conn:
+        rows = conn.execute(
+            f"SELECT id, telegram_id, marzban_username FROM subscriptions WHERE enabled=1 AND id IN ({marks})", ids
+        ).fetchall()
+    return [(sid, (int(tid), uname)) for sid, tid, uname in rows]
+
+def upsert_subscription(tid: int, marz_user: str, next_due: int) -> int:
+    with closing(connect()) as conn, conn:
+        conn.execute("""
+            INSERT INTO subscriptions (telegram_id, marzban_username, next_due, enabled)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT(telegram_id, marzban_username) DO UPDATE SET
+                next_due=excluded.next_due,
+                enabled=1,
+                last_error=NULL
+        """, (tid, marz_user, next_due))
+        row = conn.execute(
+            "SELECT id FROM subscriptions WHERE telegram_id=? AND marzban_username=?", (tid, marz_user)
+        ).fetchone()
+        return int(row[0])
+
+def set_subscription_due(sub_id: int, next_due: int, error: str | None = None):
+    with closing(connect()) as conn, conn:
+        conn.execute("UPDATE subscriptions SET next_due=?, last_error=? WHERE id=?", (next_due, error, sub_id))
+
+def disable_subscription(sub_id: int, error: str | None = None):
+    with closing(connect()) as conn, conn:
+        conn.execute("UPDATE subscriptions SET enabled=0, last_error=? WHERE id=?", (error, sub_id))
+
+def find_subscription(tid: int, marz_user: str):
+    """(id, enabled) یا None"""
+    with closing(connect()) as conn:
+        return conn.execute(
+            "SELECT id, enabled FROM subscriptions WHERE telegram_id=? AND marzban_username=?", (tid, marz_user)
+        ).fetchone()
+
+def list_subscriptions(tid: int):
+    with closing(connect()) as conn:
+        return conn.execute(
+            "SELECT marzban_username, next_due FROM subscriptions WHERE telegram_id=? AND enabled=1 ORDER BY next_due",
+            (tid,)
+        ).fetchall()
+
+LOG_EXPORT_COLUMNS = ("id", "ts_utc", "actor_id", "actor_username", "target_marzban_username", "success", "message",
+                      "correlation_id")
+LOG_EXPORT_BATCH = 500
+
+def parse_log_export_filters(text: str):
+    """
+    فرمت: <from> <to> [actor_id] با تاریخ‌های YYYY-MM-DD؛ «-» یعنی بدون فیلتر.
+    خروجی: (date_from, date_to, actor_id) که هر کدام می‌تواند None باشد.
+    """
+    parts = (text or "").split()
+    if len(parts) > 3:
+        raise ValueError("too many arguments")
+    parts += ["-"] * (3 - len(parts))
+    date_from, date_to, actor = (None if p == "-" else p for p in parts)
+    if date_from is not None:
+        date_from = datetime.strptime(date_from, "%Y-%m-%d")
+    if date_to is not None:
+        date_to = datetime.strptime(date_to, "%Y-%m-%d")
+    if actor is not None:
+        actor = int(actor)
+    return date_from, date_to, actor
+
+def export_logs_csv(dest_path: str, date_from: datetime | None = None,
+                    date_to: datetime | None = None, actor_id: int | None = None) -> int:
+    """
+    لاگ‌ها را دسته‌به‌دسته با cursor می‌خواند و مستقیم در CSV فشرده (gzip) می‌نویسد؛
+    مصرف حافظه مستقل از اندازهٔ جدول است. date_to شامل همان روز هم می‌شود.
+    تعداد ردیف‌های نوشته‌شده را برمی‌گرداند.
+    """
+    where, params = [], []
+    if date_from is not None:
+        where.append("ts_utc >= ?")
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        where.append("ts_utc < ?")
+        params.append((date_to + timedelta(days=1)).isoformat())
+    if actor_id is not None:
+        where.append("actor_id = ?")
+        params.append(actor_id)
+    sql = f"SELECT {', '.join(LOG_EXPORT_COLUMNS)} FROM logs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id"
+
+    count = 0
+    with closing(connect()) as conn, \
+            gzip.open(dest_path, "wt", encoding="utf-8-sig", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(LOG_EXPORT_COLUMNS)
+        cur = conn.execute(sql, params)
+        while True:
+            batch = cur.fetchmany(LOG_EXPORT_BATCH)
+            if not batch:
+                break
+            writer.writerows(batch)
+            count += len(batch)
+    return count
 
 def jalali_now_str() -> str:
-    now_teh = datetime.now(IR_TZ)
+    import pytz
+    import jdatetime               # pip install jdatetime
+    now_teh = datetime.now(pytz.timezone(IR_TZ_NAME))
     jnow = jdatetime.datetime.fromgregorian(datetime=now_teh)
     return jnow.strftime("%Y/%m/%d - %H:%M:%S")
 
@@ -183,8 +640,9 @@ def main_kb(is_admin_user: bool, is_super: bool) -> ReplyKeyboardMarkup:
     kb.row(KeyboardButton("🔁 تمدید کاربر"), KeyboardButton("💳 اعتبار من"))
     if is_admin_user:
         kb.row(KeyboardButton("🛠 پنل ادمین"), KeyboardButton("ℹ️ راهنما"))
+        kb.add(KeyboardButton("⏰ تمدید خودکار"))
     else:
-        kb.add(KeyboardButton("ℹ️ راهنما"))
+        kb.row(KeyboardButton("⏰ تمدید خودکار"), KeyboardButton("ℹ️ راهنما"))
     return kb
 
 def admin_kb(is_super: bool) -> ReplyKeyboardMarkup:
@@ -194,6 +652,8 @@ def admin_kb(is_super: bool) -> ReplyKeyboardMarkup:
         kb.row(KeyboardButton("➕ شارژ اعتبار"), KeyboardButton("🔁 تمدید برای مشتری"))
         kb.row(KeyboardButton("🔎 اعتبار مشتری"), KeyboardButton("👑 مدیریت ادمین‌ها"))
         kb.row(KeyboardButton("👥 لیست ادمین‌ها"), KeyboardButton("👥 لیست مشتری‌ها"))
+        kb.row(KeyboardButton("📒 گردش اعتبار"), KeyboardButton("📤 خروجی لاگ‌ها"))
+        kb.add(KeyboardButton("📥 ورود اعتبار از CSV"))
     else:
         # ادمین معمولی فقط عملیات‌های مرتبط با تمدید را می‌بیند
         kb.row(KeyboardButton("🔁 تمدید برای مشتری"), KeyboardButton("🔎 اعتبار مشتری"))
@@ -221,6 +681,9 @@ def cancel_kb() -> ReplyKeyboardMarkup:
 class RenewFlow(StatesGroup):
     ask_username = State()
 
+class AutoRenewFlow(StatesGroup):
+    ask_username = State()
+
 class AdminAddCustomerFlow(StatesGroup):
     ask_tid = State()
 
@@ -245,26 +708,124 @@ class AdminAddAdminFlow(StatesGroup):
 class AdminRmAdminFlow(StatesGroup):
     ask_tid = State()
 
+class AdminExportLogsFlow(StatesGroup):
+    ask_filters = State()
+
+class AdminStatementFlow(StatesGroup):
+    ask_tid_range = State()
+
+class AdminImportCreditsFlow(StatesGroup):
+    ask_file = State()
+
 # ---------------- ربات ----------------
-logging.basicConfig(level=logging.INFO)
+# Bot/Dispatcher/سرویس مرزبان هنگام import ساخته نمی‌شوند؛ هندلرها فقط ثبت
+# می‌شوند و build_dispatcher آن‌ها را روی Dispatcher واقعی سوار می‌کند.
+_MESSAGE_HANDLERS = []
+
+def message_handler(*custom_filters, **kwargs):
+    def decorator(callback):
+        _MESSAGE_HANDLERS.append((callback, custom_filters, kwargs))
+        return callback
+    return decorator
+
+_svc: MarzbanRenewService | None = None
+
+def get_service() -> MarzbanRenewService:
+    global _svc
+    if _svc is None:
+        _svc = MarzbanRenewService(
+            MARZBAN_ADDRESS, MARZBAN_USERNAME, MARZBAN_PASSWORD,
+            limiter=AdaptiveLimiter(max_limit=PANEL_MAX_CONCURRENCY),
+        )
+    return _svc
+
+class StartupTimer(BaseMiddleware):
+    """زمان از import ماژول تا پایان پردازش اولین آپدیت را یک بار لاگ می‌کند."""
+
+    first_update_s: float | None = None
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        if StartupTimer.first_update_s is None:
+            StartupTimer.first_update_s = time.perf_counter() - _IMPORT_T0
+            logging.info("first update handled %.1f ms after startup", StartupTimer.first_update_s * 1000)
+
+class TenantDB(BaseMiddleware):
+    """دیتابیس برند این Dispatcher را برای کل پردازش آپدیت فعال می‌کند."""
+
+    def __init__(self, path: str | None):
+        super().__init__()
+        self.path = path
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        _current_db.set(self.path)
+
+# درخواست‌هایی که از صف ارسال رد نمی‌شوند (long polling و مدیریت webhook)
+_UNSCHEDULED_METHODS = {"getUpdates", "getMe", "deleteWebhook", "setWebhook", "getWebhookInfo", "close", "logOut"}
+
+class PooledBot(Bot):
+    """
+    Bot که همهٔ نمونه‌هایش یک ClientSession مشترک دارند؛ با چند توکن در یک
+    پروسه، اتصال‌های api.telegram.org بین ربات‌ها تقسیم می‌شود.
+    هر درخواست API (پاسخ‌ها، اعلان‌ها، get_chat و ...) از صف ارسال همین
+    ربات (outbox) عبور می‌کند تا محدودیت‌های تلگرام رعایت شود. آپلود فایل
+    پس از RetryAfter تکرار نمی‌شود و خطا به handler می‌رسد.
+    """
+
+    _shared_session: aiohttp.ClientSession | None = None
+
+    def __init__(self, *args, outbox: SendScheduler | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbox = outbox or SendScheduler()
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if method in _UNSCHEDULED_METHODS:
+            return await super().request(method, data, files, **kwargs)
+        # aiohttp فایل‌های آپلود را تا ته می‌خواند و می‌بندد؛ تکرار همان درخواست
+        # فایل خالی می‌فرستد، پس درخواست‌های دارای files دوباره فرستاده نمی‌شوند
+        return await self.outbox.submit(
+            lambda: super(PooledBot, self).request(method, data, files, **kwargs),
+            chat_id=(data or {}).get("chat_id"),
+            retry=not files,
+        )
+
+    async def get_new_session(self) -> aiohttp.ClientSession:
+        if PooledBot._shared_session is None or PooledBot._shared_session.closed:
+            PooledBot._shared_session = await super().get_new_session()
+        return PooledBot._shared_session
 
-bot = Bot(token=TELEGRAM_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
+    async def close(self):
+        # نشست مشترک فقط در close_shared_session بسته می‌شود
+        await self.outbox.close()
 
-svc = MarzbanRenewService(MARZBAN_ADDRESS, MARZBAN_USERNAME, MARZBAN_PASSWORD)
+    @staticmethod
+    async def close_shared_session():
+        if PooledBot._shared_session is not None and not PooledBot._shared_session.closed:
+            await PooledBot._shared_session.close()
+
+def build_dispatcher(bot: Bot, db: str | None = None) -> Dispatcher:
+    dp = Dispatcher(bot, storage=MemoryStorage())
+    dp.middleware.setup(StartupTimer())
+    dp.middleware.setup(TenantDB(db))
+    for callback, custom_filters, kwargs in _MESSAGE_HANDLERS:
+        dp.register_message_handler(callback, *custom_filters, **kwargs)
+    return dp
 
 async def notify_admins(text: str):
+    bot = Bot.get_current()
     targets = set()
     targets |= SUPERADMINS
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with closing(connect()) as conn:
         rows = conn.execute("SELECT telegram_id FROM admins").fetchall()
         targets |= {int(r[0]) for r in rows}
-    for tid in targets:
-        try:
-            await bot.send_message(chat_id=tid, text=text)
-        except Exception:
-            pass
+    targets = sorted(targets)
+    # اعلان‌ها بعد از پاسخ‌های تعاملی ارسال می‌شوند؛ صف ارسال نرخ را کنترل می‌کند
+    with send_priority(BROADCAST):
+        results = await asyncio.gather(
+            *(bot.send_message(chat_id=tid, text=text) for tid in targets), return_exceptions=True
+        )
+    for tid, res in zip(targets, results):
+        if isinstance(res, Exception):
+            logging.warning("notify admin %s failed: %s", tid, res)
 
 def sync_admin_profile_if_needed(user: types.User):
     tid = user.id
@@ -273,7 +834,7 @@ def sync_admin_profile_if_needed(user: types.User):
     if is_admin(tid):
         upsert_admin_profile(tid, user.username or "", user.full_name or "")
 
-@dp.message_handler(
+@message_handler(
     lambda msg: not (is_admin(msg.from_user.id) or is_customer(msg.from_user.id)),
     content_types=types.ContentTypes.ANY,
 )
@@ -284,7 +845,7 @@ async def ignore_unknown(m: types.Message):
 # برای کاربران معمولی که هیچ اعتباری ندارند پاسخی ارسال می‌کنیم
 # تا بدانند چرا بات به پیامشان جواب نمی‌دهد. سوپرادمین‌ها از این
 # فیلتر مستثنا هستند تا همیشه دسترسی کامل داشته باشند.
-@dp.message_handler(
+@message_handler(
     lambda msg: not is_superadmin(msg.from_user.id)
     and is_customer(msg.from_user.id)
     and get_credits(msg.from_user.id) <= 0,
@@ -295,13 +856,52 @@ async def no_credit_reply(m: types.Message):
     await m.reply("اعتباری برای شما باقی نمانده است")
 
 # ---------------- دستورات عمومی ----------------
-@dp.message_handler(commands=['whoami'])
+@message_handler(commands=['whoami'])
 async def whoami(m: types.Message):
     sync_admin_profile_if_needed(m.from_user)
     role = "سوپرادمین" if is_superadmin(m.from_user.id) else ("ادمین" if is_admin(m.from_user.id) else "کاربر")
     await m.reply(f"ID: {m.from_user.id}\nنقش: {role}")
 
-@dp.message_handler(commands=['start'])
+@message_handler(commands=['stats'])
+async def stats(m: types.Message):
+    sync_admin_profile_if_needed(m.from_user)
+    if not is_superadmin(m.from_user.id):
+        return await m.reply("فقط سوپرادمین.")
+    lines = []
+    outbox = getattr(m.bot, "outbox", None)
+    if outbox is not None:
+        by_priority = outbox.depth_by_priority()
+        lines.append(f"صف ارسال: {outbox.depth} (تعاملی در انتظار: {by_priority.get(INTERACTIVE, 0)}، اعلان در انتظار: {by_priority.get(BROADCAST, 0)})")
+    limiter = get_service().limiter
+    lines.append(f"پنل: پنجره {limiter.limit}، در حال اجرا {limiter.inflight}، در صف {limiter.queued}")
+    scheduler = _schedulers.get(db_path())
+    if scheduler is not None:
+        lines.append(f"تمدید خودکار: {len(scheduler)} اشتراک زمان‌بندی‌شده")
+    checkpointer = _checkpointers.get(db_path())
+    if checkpointer is not None and checkpointer.last is not None:
+        busy, frames, done = checkpointer.last
+        lines.append(f"WAL: آخرین checkpoint {done}/{frames} فریم{' (مشغول)' if busy else ''}")
+    await m.reply("\n".join(lines))
+
+@message_handler(commands=['backup'])
+async def backup_now(m: types.Message):
+    sync_admin_profile_if_needed(m.from_user)
+    if not is_superadmin(m.from_user.id):
+        return await m.reply("فقط سوپرادمین.")
+    runner = get_backup_runner(db_path())
+    try:
+        path = await runner.backup()
+    except Exception as e:
+        logging.exception("on-demand backup failed")
+        return await m.reply(f"❌ پشتیبان‌گیری ناموفق بود: {e}")
+    size = os.path.getsize(path)
+    caption = f"💾 پشتیبان ({size // 1024} KB، {runner.last_duration:.1f} ثانیه)"
+    if size > TELEGRAM_UPLOAD_LIMIT:
+        return await m.reply(f"{caption}\nحجم فایل برای ارسال زیاد است؛ روی سرور: {path}")
+    with open(path, "rb") as fh:
+        await m.reply_document(types.InputFile(fh, filename=os.path.basename(path)), caption=caption)
+
+@message_handler(commands=['start'])
 async def start(m: types.Message, state: FSMContext):
     await state.finish()
     sync_admin_profile_if_needed(m.from_user)
@@ -310,24 +910,25 @@ async def start(m: types.Message, state: FSMContext):
         reply_markup=main_kb(is_admin(m.from_user.id), is_superadmin(m.from_user.id))
     )
 
-@dp.message_handler(lambda msg: msg.text == "ℹ️ راهنما")
+@message_handler(lambda msg: msg.text == "ℹ️ راهنما")
 async def help_btn(m: types.Message):
     sync_admin_profile_if_needed(m.from_user)
     await m.reply(
         "با دکمه‌ها کار کن:\n"
         "🔁 «تمدید کاربر» → نام کاربری را می‌گیرد و تمدید ۳۱روزه انجام می‌دهد.\n"
         "💳 «اعتبار من» → تعداد تمدیدهای باقی‌مانده را نشان می‌دهد.\n"
+        "⏰ «تمدید خودکار» → نام کاربری را کمی قبل از انقضا خودکار تمدید می‌کند (روشن/خاموش).\n"
         "🛠 «پنل ادمین» → فقط برای ادمین‌ها."
     )
 
-@dp.message_handler(lambda msg: msg.text == "💳 اعتبار من")
+@message_handler(lambda msg: msg.text == "💳 اعتبار من")
 async def my_credits_btn(m: types.Message):
     sync_admin_profile_if_needed(m.from_user)
     cr = get_credits(m.from_user.id)
     await m.reply(f"اعتبار تمدید باقی‌مانده: {cr}")
 
 # ---------------- انصراف سراسری (برای همه مراحل) ----------------
-@dp.message_handler(lambda msg: msg.text == "⬅️ انصراف", state='*')
+@message_handler(lambda msg: msg.text == "⬅️ انصراف", state='*')
 async def cancel_any(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     current = await state.get_state()
@@ -336,7 +937,7 @@ async def cancel_any(m: types.Message, state: FSMContext):
     await m.reply("لغو شد.", reply_markup=main_kb(is_admin(m.from_user.id), is_superadmin(m.from_user.id)))
 
 # ---------------- تمدید کاربر ----------------
-@dp.message_handler(lambda msg: msg.text == "🔁 تمدید کاربر")
+@message_handler(lambda msg: msg.text == "🔁 تمدید کاربر")
 async def renew_btn(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     cr = get_credits(m.from_user.id)
@@ -345,7 +946,8 @@ async def renew_btn(m: types.Message, state: FSMContext):
     await RenewFlow.ask_username.set()
     await m.reply("نام کاربری را ارسال کن:", reply_markup=cancel_kb())
 
-@dp.message_handler(state=RenewFlow.ask_username)
+@message_handler(state=RenewFlow.ask_username)
+@traced
 async def renew_get_username(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     username = (m.text or "").strip()
@@ -354,19 +956,22 @@ async def renew_get_username(m: types.Message, state: FSMContext):
     ok = False
     msg = ""
     try:
-        result = await svc.renew_user_31d(username)
+        result = await get_service().renew_user_31d(username)
         ok = bool(result.get("ok"))
         msg = result.get("message", "")
     except Exception as e:
         ok = False
         msg = f"خطا در ارتباط با سرور: {e}"
+    ledger_id = None
     if ok:
-        if not dec_credit(m.from_user.id):
+        ledger_id = dec_credit(m.from_user.id, "renew", m.from_user.id)
+        if not ledger_id:
             await state.finish()
             return await m.reply(
                 "اعتبار شما کافی نبود.",
                 reply_markup=main_kb(is_admin(m.from_user.id), is_superadmin(m.from_user.id))
             )
+        reschedule_after_manual_renew(m.from_user.id, username, result["expire"])
         await m.reply(
             "✅ تمدید انجام شد. (۳۱ روزه + ریست حجم + اکتیو)",
             reply_markup=main_kb(is_admin(m.from_user.id), is_superadmin(m.from_user.id))
@@ -383,12 +988,177 @@ async def renew_get_username(m: types.Message, state: FSMContext):
               f"نام کاربری: {username}\n"
               f"نتیجه: {'موفق' if ok else 'ناموفق'}\n"
               f"پیام: {msg}")
-    log_action(m.from_user.id, m.from_user.username or "", username, ok, msg)
+    log_action(m.from_user.id, m.from_user.username or "", username, ok, msg, ledger_id)
     await notify_admins(report)
     await state.finish()
 
+# ---------------- پشتیبان‌گیری ----------------
+# یک BackupRunner برای هر دیتابیس (برند)؛ کلید: مسیر دیتابیس
+_backups: dict[str, BackupRunner] = {}
+
+def get_backup_runner(path: str) -> BackupRunner:
+    runner = _backups.get(path)
+    if runner is None:
+        runner = _backups[path] = BackupRunner(
+            path, BACKUP_DIR, keep=BACKUP_KEEP, interval_s=BACKUP_INTERVAL_S, connect=connect
+        )
+    return runner
+
+# ---------------- checkpoint دیتابیس ----------------
+_checkpointers: dict[str, WalCheckpointer] = {}
+
+def get_checkpointer(path: str) -> WalCheckpointer:
+    checkpointer = _checkpointers.get(path)
+    if checkpointer is None:
+        checkpointer = _checkpointers[path] = WalCheckpointer(
+            path, connect, interval_s=WAL_CHECKPOINT_INTERVAL_S, idle_s=WAL_TRUNCATE_IDLE_S
+        )
+    return checkpointer
+
+# ---------------- تمدید خودکار ----------------
+# یک زمان‌بند برای هر دیتابیس (برند)؛ کلید: مسیر دیتابیس
+_schedulers: dict[str, RenewScheduler] = {}
+
+def make_scheduler() -> RenewScheduler:
+    return RenewScheduler(
+        subscription_due_index,
+        load_subscriptions,
+        auto_renew,
+        batch_size=AUTO_RENEW_BATCH,
+        concurrency=AUTO_RENEW_CONCURRENCY,
+        retry_s=AUTO_RENEW_RETRY_S,
+    )
+
+def _auto_renew_retry(sub_id: int, tid: int, username: str, error: Exception) -> int:
+    retry_at = int(time.time()) + AUTO_RENEW_RETRY_S
+    set_subscription_due(sub_id, retry_at, str(error))
+    logging.warning("auto-renew %s for %s failed, retrying later: %s", username, tid, error)
+    return retry_at
+
+def reschedule_after_manual_renew(tid: int, username: str, expire: int):
+    """اگر برای این کاربر تمدید خودکار روشن است، سررسیدش را از انقضای جدید حساب می‌کند."""
+    existing = find_subscription(tid, username)
+    if not existing or not existing[1]:
+        return
+    due = int(expire) - AUTO_RENEW_LEAD_S
+    set_subscription_due(existing[0], due)
+    scheduler = _schedulers.get(db_path())
+    if scheduler is not None:
+        scheduler.schedule(existing[0], due)
+
+@traced
+async def auto_renew(sub_id: int, payload) -> int | None:
+    """یک اشتراک سررسیده را تمدید می‌کند؛ سررسید بعدی یا None (غیرفعال) را برمی‌گرداند."""
+    tid, username = payload
+    bot = Bot.get_current()
+    # تمدید دستی (در ربات یا مستقیم روی پنل) ممکن است انقضا را جلو برده باشد؛
+    # در آن صورت فقط زمان‌بندی جابه‌جا می‌شود و اعتباری خرج نمی‌شود
+    try:
+        user = await get_service().get_user(username)
+    except Exception as e:
+        return _auto_renew_retry(sub_id, tid, username, e)
+    if user is not None:
+        due = int(user.get("expire") or 0) - AUTO_RENEW_LEAD_S
+        if due > time.time():
+            set_subscription_due(sub_id, due)
+            return due
+    # اعتبار قبل از تماس با پنل برداشته می‌شود تا اشتراک‌های یک مشتری که در یک
+    # دسته هم‌زمان اجرا می‌شوند یک اعتبار را چند بار خرج نکنند؛ در خطا برگردانده می‌شود
+    ledger_id = dec_credit(tid, "auto_renew")
+    if not ledger_id:
+        disable_subscription(sub_id, "no credit")
+        try:
+            with send_priority(BROADCAST):
+                await bot.send_message(tid, f"⏰ تمدید خودکار «{username}» به دلیل نبود اعتبار غیرفعال شد.")
+        except Exception as e:
+            logging.warning("auto-renew notice to %s failed: %s", tid, e)
+        return None
+    try:
+        result = await get_service().renew_user_31d(username)
+    except Exception as e:
+        add_credits(tid, 1, "auto_renew_refund")
+        return _auto_renew_retry(sub_id, tid, username, e)
+    ok = bool(result.get("ok"))
+    msg = result.get("message", "")
+    if not ok:
+        add_credits(tid, 1, "auto_renew_refund")
+        ledger_id = None
+
+    next_due = None
+    if ok:
+        next_due = int(result["expire"]) - AUTO_RENEW_LEAD_S
+        set_subscription_due(sub_id, next_due)
+    else:
+        disable_subscription(sub_id, msg)
+    log_action(tid, "auto-renew", username, ok, msg, ledger_id)
+
+    try:
+        with send_priority(BROADCAST):
+            await bot.send_message(
+                tid,
+                f"⏰ تمدید خودکار «{username}» انجام شد." if ok
+                else f"⏰ تمدید خودکار «{username}» ناموفق بود و غیرفعال شد: {msg}"
+            )
+    except Exception as e:
+        logging.warning("auto-renew notice to %s failed: %s", tid, e)
+    report = (f"🧾 گزارش تمدید خودکار ({jalali_now_str()})\n"
+              f"مشتری: {tid}\n"
+              f"نام کاربری: {username}\n"
+              f"نتیجه: {'موفق' if ok else 'ناموفق'}\n"
+              f"پیام: {msg}")
+    await notify_admins(report)
+    return next_due
+
+@message_handler(lambda msg: msg.text == "⏰ تمدید خودکار")
+async def auto_renew_btn(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    lines = [f"• {uname} — تمدید بعدی: {datetime.utcfromtimestamp(due):%Y-%m-%d %H:%M} UTC"
+             for uname, due in list_subscriptions(m.from_user.id)]
+    current = "اشتراک‌های فعال:\n" + "\n".join(lines) if lines else "هیچ تمدید خودکاری فعال نیست."
+    await AutoRenewFlow.ask_username.set()
+    await m.reply(
+        f"{current}\n\nنام کاربری را بفرست تا تمدید خودکارش روشن/خاموش شود:",
+        reply_markup=cancel_kb()
+    )
+
+@message_handler(state=AutoRenewFlow.ask_username)
+async def auto_renew_toggle(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    username = (m.text or "").strip()
+    if not username or username == "⬅️ انصراف":
+        return
+    await state.finish()
+    kb = main_kb(is_admin(m.from_user.id), is_superadmin(m.from_user.id))
+    scheduler = _schedulers.get(db_path())
+
+    existing = find_subscription(m.from_user.id, username)
+    if existing and existing[1]:
+        disable_subscription(existing[0])
+        if scheduler is not None:
+            scheduler.cancel(existing[0])
+        return await m.reply(f"تمدید خودکار «{username}» خاموش شد.", reply_markup=kb)
+
+    try:
+        user = await get_service().get_user(username)
+    except Exception as e:
+        return await m.reply(f"❌ خطا در ارتباط با سرور: {e}", reply_markup=kb)
+    if user is None:
+        return await m.reply("❌ این کاربر وجود ندارد.", reply_markup=kb)
+    expire = int(user.get("expire") or 0)
+    if expire <= 0:
+        return await m.reply("❌ این کاربر تاریخ انقضا ندارد.", reply_markup=kb)
+
+    due = max(expire - AUTO_RENEW_LEAD_S, int(time.time()))
+    sub_id = upsert_subscription(m.from_user.id, username, due)
+    if scheduler is not None:
+        scheduler.schedule(sub_id, due)
+    await m.reply(
+        f"✅ تمدید خودکار «{username}» روشن شد. تمدید بعدی: {datetime.utcfromtimestamp(due):%Y-%m-%d %H:%M} UTC",
+        reply_markup=kb
+    )
+
 # ---------------- پنل ادمین ----------------
-@dp.message_handler(lambda msg: msg.text == "🛠 پنل ادمین")
+@message_handler(lambda msg: msg.text == "🛠 پنل ادمین")
 async def admin_panel(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_admin(m.from_user.id):
@@ -402,7 +1172,7 @@ async def admin_panel(m: types.Message, state: FSMContext):
         reply_markup=admin_kb(is_superadmin(m.from_user.id))
     )
 
-@dp.message_handler(lambda msg: msg.text == "⬅️ بازگشت")
+@message_handler(lambda msg: msg.text == "⬅️ بازگشت")
 async def back_to_main(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     await state.finish()
@@ -412,7 +1182,7 @@ async def back_to_main(m: types.Message, state: FSMContext):
     )
 
 # ---- مدیریت مشتری‌ها (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "👥 مدیریت مشتری‌ها")
+@message_handler(lambda msg: msg.text == "👥 مدیریت مشتری‌ها")
 async def customers_manage(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
@@ -420,7 +1190,7 @@ async def customers_manage(m: types.Message, state: FSMContext):
     await m.reply("مدیریت مشتری‌ها:", reply_markup=customers_manage_kb())
 
 # ---- افزودن مشتری (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "➕ افزودن مشتری")
+@message_handler(lambda msg: msg.text == "➕ افزودن مشتری")
 async def admin_add_customer(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
@@ -428,7 +1198,7 @@ async def admin_add_customer(m: types.Message, state: FSMContext):
     await AdminAddCustomerFlow.ask_tid.set()
     await m.reply("آیدی عددی تلگرام مشتری را وارد کن:", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminAddCustomerFlow.ask_tid)
+@message_handler(state=AdminAddCustomerFlow.ask_tid)
 async def admin_add_customer_tid(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
@@ -441,7 +1211,7 @@ async def admin_add_customer_tid(m: types.Message, state: FSMContext):
     await state.finish()
 
 # ---- حذف مشتری (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "➖ حذف مشتری")
+@message_handler(lambda msg: msg.text == "➖ حذف مشتری")
 async def customers_rm_btn(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
@@ -449,7 +1219,7 @@ async def customers_rm_btn(m: types.Message, state: FSMContext):
     await AdminRmCustomerFlow.ask_tid.set()
     await m.reply("آیدی عددی مشتری که باید حذف شود را بفرست:", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminRmCustomerFlow.ask_tid)
+@message_handler(state=AdminRmCustomerFlow.ask_tid)
 async def customers_rm_tid(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
@@ -457,12 +1227,12 @@ async def customers_rm_tid(m: types.Message, state: FSMContext):
     if not (m.text or "").isdigit():
         return await m.reply("یک آیدی عددی معتبر بفرست.", reply_markup=cancel_kb())
     tid = int(m.text.strip())
-    remove_customer(tid)
+    remove_customer(tid, m.from_user.id)
     await m.reply(f"مشتری {tid} حذف شد.", reply_markup=customers_manage_kb())
     await state.finish()
 
 # ---- تنظیم اعتبار (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "📌 تنظیم اعتبار")
+@message_handler(lambda msg: msg.text == "📌 تنظیم اعتبار")
 async def admin_setcredits(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
@@ -470,14 +1240,14 @@ async def admin_setcredits(m: types.Message, state: FSMContext):
     await AdminSetCreditsFlow.ask_tid_amount.set()
     await m.reply("فرمت: <telegram_id> <n>\nمثال: 12345678 20", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminSetCreditsFlow.ask_tid_amount)
+@message_handler(state=AdminSetCreditsFlow.ask_tid_amount)
 async def admin_setcredits_args(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
         return
     try:
         tid_s, amt_s = (m.text or "").split()
-        set_credits(int(tid_s), int(amt_s))
+        set_credits(int(tid_s), int(amt_s), actor_id=m.from_user.id)
         await m.reply(
             f"اعتبار مشتری {tid_s} به {amt_s} تنظیم شد.",
             reply_markup=admin_kb(is_superadmin(m.from_user.id))
@@ -487,7 +1257,7 @@ async def admin_setcredits_args(m: types.Message, state: FSMContext):
         await m.reply("فرمت درست نیست. دوباره بفرست: <telegram_id> <n>", reply_markup=cancel_kb())
 
 # ---- شارژ اعتبار (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "➕ شارژ اعتبار")
+@message_handler(lambda msg: msg.text == "➕ شارژ اعتبار")
 async def admin_addcredits(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
@@ -495,14 +1265,14 @@ async def admin_addcredits(m: types.Message, state: FSMContext):
     await AdminAddCreditsFlow.ask_tid_amount.set()
     await m.reply("فرمت: <telegram_id> <n>\nمثال: 12345678 10", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminAddCreditsFlow.ask_tid_amount)
+@message_handler(state=AdminAddCreditsFlow.ask_tid_amount)
 async def admin_addcredits_args(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
         return
     try:
         tid_s, amt_s = (m.text or "").split()
-        add_credits(int(tid_s), int(amt_s))
+        add_credits(int(tid_s), int(amt_s), actor_id=m.from_user.id)
         await m.reply(
             f"{amt_s} واحد اعتبار به مشتری {tid_s} اضافه شد.",
             reply_markup=admin_kb(is_superadmin(m.from_user.id))
@@ -511,8 +1281,55 @@ async def admin_addcredits_args(m: types.Message, state: FSMContext):
     except Exception:
         await m.reply("فرمت درست نیست. دوباره بفرست: <telegram_id> <n>", reply_markup=cancel_kb())
 
+# ---- ورود گروهی اعتبار از CSV (فقط سوپرادمین)
+@message_handler(lambda msg: msg.text == "📥 ورود اعتبار از CSV")
+async def admin_import_credits(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    if not is_superadmin(m.from_user.id):
+        return await m.reply("فقط سوپرادمین.", reply_markup=admin_kb(False))
+    await AdminImportCreditsFlow.ask_file.set()
+    await m.reply(
+        "فایل CSV را بفرست. هر خط: telegram_id,op,amount\n"
+        "op یکی از set (تنظیم) یا add (افزایش)\nمثال:\n12345678,set,20\n87654321,add,5",
+        reply_markup=cancel_kb()
+    )
+
+@message_handler(state=AdminImportCreditsFlow.ask_file, content_types=types.ContentTypes.DOCUMENT)
+async def admin_import_credits_file(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    if (m.document.file_size or 0) > CREDIT_IMPORT_MAX_BYTES:
+        return await m.reply("حجم فایل زیاد است (حداکثر ۵ مگابایت).", reply_markup=cancel_kb())
+    fd, path = tempfile.mkstemp(prefix="renew-credits-", suffix=".csv")
+    os.close(fd)
+    try:
+        await m.document.download(destination_file=path)
+        summary, rows, errors = await asyncio.to_thread(import_credits_csv, path, m.from_user.id)
+    except UnicodeDecodeError:
+        return await m.reply("فایل باید CSV با کدگذاری UTF-8 باشد.", reply_markup=cancel_kb())
+    except csv.Error as e:
+        return await m.reply(f"فایل CSV خوانا نیست: {e}", reply_markup=cancel_kb())
+    finally:
+        os.remove(path)
+    if summary is None:
+        detail = "\n".join(errors) if errors else "هیچ ردیف معتبری پیدا نشد."
+        return await m.reply(f"❌ هیچ تغییری اعمال نشد.\n{detail}", reply_markup=cancel_kb())
+    await state.finish()
+    await m.reply(
+        f"✅ ورود اعتبار انجام شد.\n"
+        f"ردیف‌ها: {rows}\n"
+        f"مشتری‌ها: {summary['customers']} (جدید: {summary['created']})\n"
+        f"ماندهٔ تغییرکرده: {summary['changed']}",
+        reply_markup=admin_kb(True)
+    )
+
+@message_handler(state=AdminImportCreditsFlow.ask_file)
+async def admin_import_credits_text(m: types.Message, state: FSMContext):
+    if (m.text or "") == "⬅️ انصراف":
+        return
+    await m.reply("فایل CSV را به‌صورت سند (Document) بفرست.", reply_markup=cancel_kb())
+
 # ---- تمدید برای مشتری (ادمین و سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "🔁 تمدید برای مشتری")
+@message_handler(lambda msg: msg.text == "🔁 تمدید برای مشتری")
 async def admin_renew_for(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_admin(m.from_user.id):
@@ -520,7 +1337,8 @@ async def admin_renew_for(m: types.Message, state: FSMContext):
     await AdminRenewForFlow.ask_tid_username.set()
     await m.reply("فرمت: <telegram_id> <username>\nمثال: 12345678 myuser", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminRenewForFlow.ask_tid_username)
+@message_handler(state=AdminRenewForFlow.ask_tid_username)
+@traced
 async def admin_renew_for_args(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
@@ -538,17 +1356,20 @@ async def admin_renew_for_args(m: types.Message, state: FSMContext):
     ok = False
     msg = ""
     try:
-        result = await svc.renew_user_31d(username.strip())
+        result = await get_service().renew_user_31d(username.strip())
         ok = bool(result.get("ok"))
         msg = result.get("message", "")
     except Exception as e:
         ok = False
         msg = f"خطا در ارتباط با سرور: {e}"
 
+    ledger_id = None
     if ok:
-        if not dec_credit(tid):
+        ledger_id = dec_credit(tid, "renew", m.from_user.id)
+        if not ledger_id:
             await m.reply("اعتبار مشتری کافی نبود (Race).", reply_markup=admin_kb(is_superadmin(m.from_user.id)))
         else:
+            reschedule_after_manual_renew(tid, username.strip(), result["expire"])
             await m.reply(f"✅ تمدید برای {tid} انجام شد.", reply_markup=admin_kb(is_superadmin(m.from_user.id)))
     else:
         await m.reply(f"❌ {msg or 'تمدید ناموفق بود.'}", reply_markup=admin_kb(is_superadmin(m.from_user.id)))
@@ -561,12 +1382,12 @@ async def admin_renew_for_args(m: types.Message, state: FSMContext):
               f"نام کاربری: {username}\n"
               f"نتیجه: {'موفق' if ok else 'ناموفق'}\n"
               f"پیام: {msg}")
-    log_action(m.from_user.id, m.from_user.username or "", username, ok, msg)
+    log_action(m.from_user.id, m.from_user.username or "", username, ok, msg, ledger_id)
     await notify_admins(report)
     await state.finish()
 
 # ---- اعتبار مشتری (ادمین و سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "🔎 اعتبار مشتری")
+@message_handler(lambda msg: msg.text == "🔎 اعتبار مشتری")
 async def admin_getcredits(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_admin(m.from_user.id):
@@ -574,7 +1395,7 @@ async def admin_getcredits(m: types.Message, state: FSMContext):
     await AdminGetCreditsFlow.ask_tid.set()
     await m.reply("آیدی عددی مشتری را بفرست:", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminGetCreditsFlow.ask_tid)
+@message_handler(state=AdminGetCreditsFlow.ask_tid)
 async def admin_getcredits_tid(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
@@ -587,14 +1408,14 @@ async def admin_getcredits_tid(m: types.Message, state: FSMContext):
     await state.finish()
 
 # ---- مدیریت ادمین‌ها (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "👑 مدیریت ادمین‌ها")
+@message_handler(lambda msg: msg.text == "👑 مدیریت ادمین‌ها")
 async def admins_manage(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
         return await m.reply("فقط سوپرادمین.")
     await m.reply("مدیریت ادمین‌ها:", reply_markup=admins_manage_kb())
 
-@dp.message_handler(lambda msg: msg.text == "➕ افزودن ادمین")
+@message_handler(lambda msg: msg.text == "➕ افزودن ادمین")
 async def admins_add_btn(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
@@ -602,7 +1423,7 @@ async def admins_add_btn(m: types.Message, state: FSMContext):
     await AdminAddAdminFlow.ask_tid.set()
     await m.reply("آیدی عددی تلگرام ادمین جدید را بفرست:", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminAddAdminFlow.ask_tid)
+@message_handler(state=AdminAddAdminFlow.ask_tid)
 async def admins_add_tid(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
@@ -614,7 +1435,7 @@ async def admins_add_tid(m: types.Message, state: FSMContext):
     await m.reply(f"ادمین {tid} افزوده شد.", reply_markup=admins_manage_kb())
     await state.finish()
 
-@dp.message_handler(lambda msg: msg.text == "➖ حذف ادمین")
+@message_handler(lambda msg: msg.text == "➖ حذف ادمین")
 async def admins_rm_btn(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
@@ -622,7 +1443,7 @@ async def admins_rm_btn(m: types.Message, state: FSMContext):
     await AdminRmAdminFlow.ask_tid.set()
     await m.reply("آیدی عددی تلگرام ادمینی که باید حذف شود را بفرست:", reply_markup=cancel_kb())
 
-@dp.message_handler(state=AdminRmAdminFlow.ask_tid)
+@message_handler(state=AdminRmAdminFlow.ask_tid)
 async def admins_rm_tid(m: types.Message, state: FSMContext):
     sync_admin_profile_if_needed(m.from_user)
     if (m.text or "") == "⬅️ انصراف":
@@ -635,12 +1456,12 @@ async def admins_rm_tid(m: types.Message, state: FSMContext):
     await state.finish()
 
 # ---- لیست ادمین‌ها (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "👥 لیست ادمین‌ها")
+@message_handler(lambda msg: msg.text == "👥 لیست ادمین‌ها")
 async def admins_list(m: types.Message):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
         return await m.reply("فقط سوپرادمین.")
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with closing(connect()) as conn:
         rows = conn.execute("SELECT telegram_id, COALESCE(username,''), COALESCE(full_name,'') FROM admins ORDER BY telegram_id").fetchall()
     if not rows:
         return await m.reply("هیچ ادمینی در سیستم ثبت نشده است.")
@@ -652,12 +1473,12 @@ async def admins_list(m: types.Message):
     await m.reply("لیست ادمین‌ها:\n" + "\n".join(lines))
 
 # ---- لیست مشتری‌ها (فقط سوپرادمین)
-@dp.message_handler(lambda msg: msg.text == "👥 لیست مشتری‌ها")
+@message_handler(lambda msg: msg.text == "👥 لیست مشتری‌ها")
 async def customers_list(m: types.Message):
     sync_admin_profile_if_needed(m.from_user)
     if not is_superadmin(m.from_user.id):
         return await m.reply("فقط سوپرادمین.")
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with closing(connect()) as conn:
         rows = conn.execute(
             "SELECT telegram_id, COALESCE(username,''), COALESCE(full_name,''), credits FROM customers ORDER BY telegram_id"
         ).fetchall()
@@ -667,7 +1488,8 @@ async def customers_list(m: types.Message):
     for tid, uname, fname, credits in rows:
         if not uname or not fname:
             try:
-                chat = await bot.get_chat(tid)
+                with send_priority(BROADCAST):
+                    chat = await m.bot.get_chat(tid)
                 uname = uname or (chat.username or "")
                 fname = fname or (chat.full_name or "")
                 ensure_customer(tid, uname or "", fname or "")
@@ -678,14 +1500,153 @@ async def customers_list(m: types.Message):
         lines.append(f"• {tid}  {tag}{name} - اعتبار: {credits}")
     await m.reply("لیست مشتری‌ها:\n" + "\n".join(lines))
 
+# ---- گردش اعتبار (فقط سوپرادمین)
+@message_handler(lambda msg: msg.text == "📒 گردش اعتبار")
+async def statement_btn(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    if not is_superadmin(m.from_user.id):
+        return await m.reply("فقط سوپرادمین.")
+    await AdminStatementFlow.ask_tid_range.set()
+    await m.reply(
+        "فرمت: <telegram_id> [from] [to] (تاریخ میلادی YYYY-MM-DD)\nمثال: 12345678 2024-01-01 2024-01-31",
+        reply_markup=cancel_kb()
+    )
+
+@message_handler(state=AdminStatementFlow.ask_tid_range)
+async def statement_args(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    if (m.text or "") == "⬅️ انصراف":
+        return
+    try:
+        tid, date_from, date_to = parse_statement_args(m.text)
+    except Exception:
+        return await m.reply("فرمت درست نیست. دوباره بفرست: <telegram_id> [from] [to]", reply_markup=cancel_kb())
+    await state.finish()
+    opening, closing_balance, credit_in, credit_out, count, rows = credit_statement(tid, date_from, date_to)
+    lines = [
+        f"📒 گردش اعتبار مشتری {tid}",
+        f"ماندهٔ ابتدای بازه: {opening}",
+        f"ورودی: +{credit_in}  خروجی: -{credit_out}  (تعداد: {count})",
+        f"ماندهٔ انتهای بازه: {closing_balance}",
+    ]
+    if rows:
+        if count > len(rows):
+            lines.append(f"\n{len(rows)} ردیف آخر:")
+        else:
+            lines.append("")
+        for ts, delta, balance, reason, actor_id, log_id in rows:
+            who = f" توسط {actor_id}" if actor_id is not None else ""
+            log_ref = f" (لاگ #{log_id})" if log_id is not None else ""
+            lines.append(f"• {ts[:19].replace('T', ' ')}  {delta:+d} → {balance}  {reason}{who}{log_ref}")
+    await m.reply("\n".join(lines), reply_markup=admin_kb(True))
+
+# ---- خروجی لاگ‌ها (فقط سوپرادمین)
+@message_handler(lambda msg: msg.text == "📤 خروجی لاگ‌ها")
+async def logs_export_btn(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    if not is_superadmin(m.from_user.id):
+        return await m.reply("فقط سوپرادمین.")
+    await AdminExportLogsFlow.ask_filters.set()
+    await m.reply(
+        "فرمت: <from> <to> [actor_id] (تاریخ میلادی YYYY-MM-DD، «-» یعنی بدون فیلتر)\n"
+        "مثال: 2024-01-01 2024-01-31 12345678\n"
+        "برای همهٔ لاگ‌ها فقط «-» بفرست.",
+        reply_markup=cancel_kb()
+    )
+
+@message_handler(state=AdminExportLogsFlow.ask_filters)
+async def logs_export_args(m: types.Message, state: FSMContext):
+    sync_admin_profile_if_needed(m.from_user)
+    if (m.text or "") == "⬅️ انصراف":
+        return
+    try:
+        date_from, date_to, actor_id = parse_log_export_filters(m.text)
+    except Exception:
+        return await m.reply("فرمت درست نیست. دوباره بفرست: <from> <to> [actor_id]", reply_markup=cancel_kb())
+    await state.finish()
+
+    fd, path = tempfile.mkstemp(prefix="renew-logs-", suffix=".csv.gz")
+    os.close(fd)
+    try:
+        count = await asyncio.to_thread(export_logs_csv, path, date_from, date_to, actor_id)
+        size = os.path.getsize(path)
+        if size > TELEGRAM_UPLOAD_LIMIT:
+            return await m.reply(
+                f"خروجی ({count} ردیف، {size // (1024 * 1024)} MB) برای ارسال در تلگرام بزرگ است؛ "
+                "بازهٔ تاریخ کوتاه‌تری بفرست.",
+                reply_markup=admin_kb(True)
+            )
+        filename = f"logs-{datetime.utcnow():%Y%m%d-%H%M%S}.csv.gz"
+        with open(path, "rb") as fh:
+            await m.reply_document(
+                types.InputFile(fh, filename=filename),
+                caption=f"تعداد ردیف‌ها: {count}",
+                reply_markup=admin_kb(True)
+            )
+    finally:
+        os.remove(path)
+
 # ---------------- اجرا ----------------
-if __name__ == "__main__":
-    init_db()
+def bot_configs():
+    """(token, db_path) برای ربات اصلی و هر برند TENANT_BOTS."""
+    configs = [(TELEGRAM_TOKEN, DB_PATH)]
+    configs += [(token, tenant_db_path(name)) for name, token in TENANT_BOTS.items()]
+    return configs
+
+async def _in_tenant(dp: Dispatcher, path: str, coro):
+    """کار پس‌زمینه را با Bot و دیتابیس همان برند اجرا می‌کند."""
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    with use_db(path):
+        return await coro
+
+async def run_bots(tenants: list[tuple[Dispatcher, str]]):
+    """همهٔ Dispatcherها را در یک event loop و با منابع مشترک poll می‌کند."""
+    dps = [dp for dp, _ in tenants]
+    for dp in dps:
+        await dp.skip_updates()
+    background = []
+    for dp, path in tenants:
+        _schedulers[path] = make_scheduler()
+        background.append(asyncio.create_task(_in_tenant(dp, path, _schedulers[path].run())))
+        background.append(asyncio.create_task(_in_tenant(dp, path, get_backup_runner(path).run())))
+        background.append(asyncio.create_task(_in_tenant(dp, path, get_checkpointer(path).run())))
+    try:
+        await asyncio.gather(*(dp.start_polling() for dp in dps))
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        for dp in dps:
+            dp.stop_polling()
+            await dp.storage.close()
+            await dp.storage.wait_closed()
+            await dp.bot.close()
+        await PooledBot.close_shared_session()
+        if _svc is not None:
+            await _svc.close()
+
+def main():
+    listener = setup_logging(LOG_LEVEL)
+    try:
+        _main()
+    finally:
+        listener.stop()
+
+def _main():
+    configs = bot_configs()
+    for _, path in configs:
+        with use_db(path):
+            init_db()
     if not BOT_STATUS:
         print("Bot status is off. Exiting.")
-    else:
-        try:
-            executor.start_polling(dp, skip_updates=True)
-        finally:
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(svc.close())
+        return
+    logging.info("startup ready in %.1f ms", (time.perf_counter() - _IMPORT_T0) * 1000)
+    tenants = [(build_dispatcher(PooledBot(token=token), path), path) for token, path in configs]
+    try:
+        asyncio.run(run_bots(tenants))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class WalCheckpointer:
+    """
+    checkpoint زمان‌بندی‌شدهٔ WAL برای یک دیتابیس.
+
+    هر interval_s یک checkpoint از نوع PASSIVE (بدون منتظر ماندن برای
+    خواننده/نویسنده) در thread جدا اجرا می‌شود تا WAL بزرگ نشود و
+    auto-checkpoint روی مسیر نوشتن نیفتد. اگر فایل WAL به مدت idle_s تغییری
+    نکرده باشد، یک TRUNCATE هم اجرا می‌شود تا فایل WAL به صفر برگردد.
+
+    در طول run یک اتصال باز نگه داشته می‌شود؛ وگرنه بستن آخرین اتصالِ
+    هر تابع دیتابیس خودش checkpoint کامل و حذف WAL را روی مسیر درخواست انجام می‌دهد.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        connect: Callable[..., sqlite3.Connection] = sqlite3.connect,
+        interval_s: float = 60.0,
+        idle_s: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.db_path = db_path
+        self.interval_s = interval_s
+        self.idle_s = idle_s
+        self._connect = connect
+        self._clock = clock
+        self._wal_state: Optional[Tuple[int, int]] = None
+        self._wal_changed_at = clock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # (busy, log_frames, checkpointed_frames) آخرین checkpoint
+        self.last: Optional[Tuple[int, int, int]] = None
+
+    def _wal_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.db_path + "-wal")
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def open(self) -> None:
+        if self._conn is None:
+            self._conn = self._connect(self.db_path, check_same_thread=False)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def checkpoint(self, mode: str = "PASSIVE") -> Tuple[int, int, int]:
+        self.open()
+        busy, frames, done = self._conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        self.last = (busy, frames, done)
+        return self.last
+
+    def tick(self) -> str:
+        """یک دور: PASSIVE، و TRUNCATE اگر WAL به اندازهٔ کافی بی‌تغییر مانده. نوع اجراشده را برمی‌گرداند."""
+        now = self._clock()
+        signature = self._wal_signature()
+        if signature != self._wal_state:
+            self._wal_state = signature
+            self._wal_changed_at = now
+        if signature is None or signature[0] == 0:
+            return "none"
+        if now - self._wal_changed_at >= self.idle_s:
+            busy, _, _ = self.checkpoint("TRUNCATE")
+            if not busy:
+                self._wal_state = self._wal_signature()
+            return "truncate"
+        self.checkpoint("PASSIVE")
+        return "passive"
+
+    async def run(self) -> None:
+        if self.interval_s <= 0:
+            return
+        await asyncio.to_thread(self.open)
+        try:
+            while True:
+                await asyncio.sleep(self.interval_s)
+                try:
+                    await asyncio.to_thread(self.tick)
+                except Exception:
+                    log.exception("WAL checkpoint of %s failed", self.db_path)
+        finally:
+            self.close()
@@ -3,10 +3,12 @@ set -e
 
 ENV_FILE=".env"
 DB_DIR="/var/lib/marzban/renew-tg-bot"
+BACKUP_DIR="/var/backups/renew-tg-bot"
 
 if [ "$1" = "uninstall" ]; then
   rm -rf venv "$ENV_FILE" "$DB_DIR"
   echo "Uninstallation complete."
+  [ -d "$BACKUP_DIR" ] && echo "Database backups were kept in $BACKUP_DIR."
   exit 0
 fi
 
@@ -0,0 +1,109 @@
+import functools
+import json
+import logging
+import queue
+import sys
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+# ویژگی‌های استاندارد LogRecord؛ بقیه (extra=...) به‌عنوان فیلد JSON خروجی می‌روند
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "correlation_id"}
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+@contextmanager
+def correlation(cid: Optional[str] = None):
+    """لاگ‌ها، درخواست‌های پنل و سطر logs داخل این بلوک یک شناسهٔ مشترک می‌گیرند."""
+    token = _correlation_id.set(cid or new_correlation_id())
+    try:
+        yield _correlation_id.get()
+    finally:
+        _correlation_id.reset(token)
+
+
+def traced(func):
+    """هر اجرای coroutine تابع را در correlation() جدید اجرا می‌کند."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with correlation():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = _correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """هر رکورد یک خط JSON: ts، level، logger، msg، correlation_id و فیلدهای extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        cid = getattr(record, "correlation_id", None)
+        if cid:
+            entry["correlation_id"] = cid
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # پیام و traceback همین‌جا ساخته می‌شوند تا args و exc_info به thread دیگر نروند؛
+        # قالب‌بندی JSON و نوشتن در thread شنونده انجام می‌شود
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: int | str = logging.INFO, stream=None) -> QueueListener:
+    """
+    روت لاگر را به یک QueueHandler وصل می‌کند؛ نوشتن JSON روی stream در
+    thread یک QueueListener انجام می‌شود تا event loop منتظر I/O نماند.
+    listener برگشتی باید هنگام خروج stop شود.
+    """
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    out = logging.StreamHandler(stream or sys.stderr)
+    out.setFormatter(JsonFormatter())
+    handler = _QueueHandler(q)
+    handler.addFilter(CorrelationFilter())
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(q, out, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Optional
+
+
+class Slot:
+    """
+    یک مجوز اجرای درخواست. فراخواننده پس از دیدن پاسخ overloaded را تنظیم
+    می‌کند (مثلاً True برای 5xx)؛ اگر تنظیم نشود و استثنا رخ دهد، بار زیاد فرض می‌شود.
+    """
+
+    __slots__ = ("overloaded",)
+
+    def __init__(self):
+        self.overloaded: Optional[bool] = None
+
+
+class AdaptiveLimiter:
+    """
+    محدودکنندهٔ هم‌زمانی AIMD.
+
+    تا وقتی تأخیر نزدیک خط پایه (کمترین تأخیر دیده‌شده) است، پنجره به‌ازای هر
+    پنجرهٔ کامل از پاسخ‌ها یک واحد بزرگ می‌شود؛ با تأخیر بیش از
+    latency_tolerance برابرِ خط پایه یا پاسخ overloaded، پنجره در decrease
+    ضرب می‌شود (حداکثر یک بار در هر رفت‌وبرگشت). درخواست‌های اضافه به ترتیب
+    ورود (FIFO) در صف می‌مانند.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        baseline_drift: float = 0.01,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.baseline_drift = baseline_drift
+        self._clock = clock
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._baseline: Optional[float] = None
+        self._last_decrease = float("-inf")
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def baseline(self) -> Optional[float]:
+        return self._baseline
+
+    async def acquire(self) -> None:
+        if not self._waiters and self._inflight < self.limit:
+            self._inflight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # مجوز داده شده بود ولی استفاده نشد؛ به نفر بعدی می‌رسد
+                self._inflight -= 1
+                self._wake()
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        """latency=None یعنی نمونه‌ای ثبت نشود (مثلاً درخواست لغو شد)."""
+        self._inflight -= 1
+        if latency is not None:
+            self._on_sample(latency, overloaded)
+        self._wake()
+
+    def _on_sample(self, latency: float, overloaded: bool) -> None:
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            # خط پایه آهسته به سمت تأخیرهای جدید می‌رود تا تغییر دائمی شبکه را بپذیرد
+            self._baseline += (latency - self._baseline) * self.baseline_drift
+
+        if overloaded or latency > self._baseline * self.latency_tolerance:
+            now = self._clock()
+            if now - self._last_decrease >= self._baseline:
+                self._limit = max(float(self.min_limit), self._limit * self.decrease)
+                self._last_decrease = now
+        elif self._inflight + 1 >= self.limit:
+            # فقط وقتی پنجره واقعاً پر بوده رشد می‌کنیم
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+
+    def _wake(self) -> None:
+        while self._waiters and self._inflight < self.limit:
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self._inflight += 1
+            fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Slot]:
+        await self.acquire()
+        slot = Slot()
+        started = self._clock()
+        try:
+            yield slot
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except BaseException:
+            self.release(self._clock() - started, slot.overloaded is not False)
+            raise
+        else:
+            self.release(self._clock() - started, bool(slot.overloaded))
@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram.utils.exceptions import RetryAfter
+
+log = logging.getLogger(__name__)
+
+# اولویت‌ها: عدد کمتر زودتر ارسال می‌شود
+INTERACTIVE = 0
+BROADCAST = 1
+
+_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def send_priority(priority: int):
+    """ارسال‌های داخل این بلوک (مثلاً اعلان‌های گروهی) با این اولویت صف می‌شوند."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._stamp = clock()
+        self._paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def delay(self) -> float:
+        """ثانیه تا آماده شدن یک توکن."""
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill(self._clock())
+        self._tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self._tokens = 0
+
+    def idle(self) -> bool:
+        self._refill(self._clock())
+        return self._tokens >= self.burst and not self.lock.locked()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while (wait := self.delay()) > 0:
+                await asyncio.sleep(wait)
+            self.take()
+
+
+class SendScheduler:
+    """
+    صف مرکزی درخواست‌های خروجی یک ربات.
+
+    هر درخواست اول از سطل توکن چت خودش (per_chat_rate) و بعد از سطل سراسری
+    (global_rate) رد می‌شود؛ سطل سراسری به ترتیب اولویت (INTERACTIVE قبل از
+    BROADCAST) و سپس ترتیب ورود توکن می‌دهد. با RetryAfter همان چت (یا کل
+    ربات اگر چتی در کار نیست) به اندازهٔ retry_after متوقف و درخواست دوباره
+    صف می‌شود؛ با retry=False فقط توقف اعمال و خطا به فراخواننده برگردانده
+    می‌شود.
+    """
+
+    MAX_IDLE_BUCKETS = 10_000
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: float = 3.0,
+        max_retries: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._kick = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._pending = 0
+
+    @property
+    def depth(self) -> int:
+        """درخواست‌هایی که وارد شده‌اند و هنوز تمام نشده‌اند (در صف یا در حال ارسال)."""
+        return self._pending
+
+    def depth_by_priority(self) -> Dict[int, int]:
+        counts: Dict[int, int] = {}
+        for priority, _, fut in self._waiting:
+            if not fut.done():
+                counts[priority] = counts.get(priority, 0) + 1
+        return counts
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_IDLE_BUCKETS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst, self._clock)
+        return bucket
+
+    async def _dispatch(self) -> None:
+        while True:
+            while not self._waiting:
+                self._kick.clear()
+                await self._kick.wait()
+            while (wait := self._global.delay()) > 0:
+                await asyncio.sleep(wait)
+            while self._waiting:
+                _, _, fut = heapq.heappop(self._waiting)
+                if not fut.done():
+                    self._global.take()
+                    fut.set_result(None)
+                    break
+
+    async def _global_acquire(self, priority: int) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._seq), fut))
+        self._kick.set()
+        await fut
+
+    async def submit(self, call: Callable[[], Awaitable], chat_id=None, priority: Optional[int] = None,
+                     retry: bool = True):
+        if priority is None:
+            priority = current_priority()
+        self._pending += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                if chat_id is not None:
+                    await self._chat_bucket(chat_id).acquire()
+                await self._global_acquire(priority)
+                try:
+                    return await call()
+                except RetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+                    bucket = self._chat_bucket(chat_id) if chat_id is not None else self._global
+                    bucket.pause(e.timeout)
+                    if not retry:
+                        raise
+                    log.warning("flood control for chat %s: retrying in %ss", chat_id, e.timeout)
+        finally:
+            self._pending -= 1
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
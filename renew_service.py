@@ -1,9 +1,32 @@
 import asyncio
+import json
+import logging
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 
 import aiohttp
 
+from jsonlog import current_correlation_id
+from limiter import AdaptiveLimiter
+
+try:  # pip install orjson (اختیاری)
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
+
+JsonLoads = Callable[[bytes], Any]
+JsonDumps = Callable[[Any], bytes]
+
+
+def default_json_codec() -> tuple[JsonLoads, JsonDumps]:
+    """(loads, dumps) روی bytes؛ orjson اگر نصب باشد، وگرنه json استاندارد."""
+    if orjson is not None:
+        return orjson.loads, orjson.dumps
+    return json.loads, lambda obj: json.dumps(obj, separators=(",", ":")).encode()
+
 
 class MarzbanRenewService:
     """
@@ -11,12 +34,19 @@ class MarzbanRenewService:
     اگر کاربر وجود نداشت، پیام فارسی برمی‌گرداند.
     """
 
-    def __init__(self, address: str, username: str, password: str):
+    def __init__(self, address: str, username: str, password: str,
+                 json_loads: Optional[JsonLoads] = None, json_dumps: Optional[JsonDumps] = None,
+                 limiter: Optional[AdaptiveLimiter] = None):
         self.address = address.rstrip("/")
         self.username = username
         self.password = password
         self.session: Optional[aiohttp.ClientSession] = None
         self._token: Optional[str] = None
+        # همهٔ درخواست‌های کاربر (get/put/reset) از یک پنجرهٔ هم‌زمانی تطبیقی رد می‌شوند
+        self.limiter = limiter or AdaptiveLimiter()
+        default_loads, default_dumps = default_json_codec()
+        self._loads: JsonLoads = json_loads or default_loads
+        self._dumps: JsonDumps = json_dumps or default_dumps
 
     async def _ensure_session(self):
         if self.session is None or self.session.closed:
@@ -39,17 +69,34 @@ class MarzbanRenewService:
             form = {"username": self.username, "password": self.password}
             headers = {"Content-Type": "application/x-www-form-urlencoded"}
             async with self.session.post(url, data=form, headers=headers) as r:
-                text = await r.text()
+                body = await r.read()
                 if r.status != 200:
-                    raise RuntimeError(f"عدم موفقیت در دریافت توکن ({r.status}): {text}")
+                    raise RuntimeError(f"عدم موفقیت در دریافت توکن ({r.status}): {self._text(body)}")
                 try:
-                    data = await r.json()
+                    data = self._loads(body)
                 except Exception:
-                    raise RuntimeError(f"پاسخ غیرقابل‌خواندن از سرور توکن: {text}")
+                    raise RuntimeError(f"پاسخ غیرقابل‌خواندن از سرور توکن: {self._text(body)}")
                 self._token = data.get("access_token") or data.get("token")
                 if not self._token:
                     raise RuntimeError(f"توکن در پاسخ سرور یافت نشد: {data}")
-        return {"Authorization": f"Bearer {self._token}"}
+        headers = {"Authorization": f"Bearer {self._token}"}
+        cid = current_correlation_id()
+        if cid:
+            # پنل (یا پروکسی جلوی آن) می‌تواند همین شناسه را در لاگ خودش ثبت کند
+            headers["X-Request-ID"] = cid
+        return headers
+
+    @staticmethod
+    def _trace(method: str, url: str, status: int, started: float) -> None:
+        log.info(
+            "panel %s %s -> %s", method, url, status,
+            extra={"method": method, "url": url, "status": status,
+                   "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)},
+        )
+
+    @staticmethod
+    def _text(body: bytes) -> str:
+        return body.decode("utf-8", errors="replace")
 
     @staticmethod
     def _expire_in_31_days_seconds() -> int:
@@ -57,50 +104,69 @@ class MarzbanRenewService:
         expires_at = datetime.now(timezone.utc) + timedelta(days=31)
         return int(expires_at.timestamp())
 
-    async def _get_user(self, username: str) -> Optional[Dict[str, Any]]:
+    async def _get_user(self, username: str, decode: bool = True) -> Optional[Any]:
+        """
+        کاربر یا None اگر وجود نداشت. با decode=False بدنه (proxies، links و ...)
+        فقط خوانده می‌شود تا اتصال به pool برگردد و همان bytes برمی‌گردد.
+        """
         url = f"{self.address}/api/user/{username}"
         for attempt in range(2):
             headers = await self._auth_headers()
-            async with self.session.get(url, headers=headers) as r:
+            started = time.perf_counter()
+            async with self.limiter.slot() as slot, self.session.get(url, headers=headers) as r:
+                slot.overloaded = r.status >= 500
+                self._trace("GET", url, r.status, started)
                 if r.status == 401 and attempt == 0:
                     self._token = None
                     continue
                 if r.status == 404:
                     return None
+                body = await r.read()
                 if r.status != 200:
-                    text = await r.text()
-                    raise RuntimeError(f"خطا در دریافت کاربر ({r.status}): {text}")
-                return await r.json()
+                    raise RuntimeError(f"خطا در دریافت کاربر ({r.status}): {self._text(body)}")
+                return self._loads(body) if decode else body
         raise RuntimeError("خطا در دریافت کاربر پس از تلاش مجدد")
 
+    async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """اطلاعات کاربر مرزبان یا None اگر وجود نداشت."""
+        return await self._get_user(username)
+
     async def _modify_user(self, username: str, **fields) -> Dict[str, Any]:
         url = f"{self.address}/api/user/{username}"
+        payload = self._dumps(fields)
         for attempt in range(2):
             headers = await self._auth_headers()
-            async with self.session.put(url, headers=headers, json=fields) as r:
-                text = await r.text()
+            headers["Content-Type"] = "application/json"
+            started = time.perf_counter()
+            async with self.limiter.slot() as slot, self.session.put(url, headers=headers, data=payload) as r:
+                slot.overloaded = r.status >= 500
+                self._trace("PUT", url, r.status, started)
+                body = await r.read()
                 if r.status == 401 and attempt == 0:
                     self._token = None
                     continue
                 if r.status not in (200, 201):
-                    raise RuntimeError(f"خطا در بروزرسانی کاربر ({r.status}): {text}")
+                    raise RuntimeError(f"خطا در بروزرسانی کاربر ({r.status}): {self._text(body)}")
                 try:
-                    return await r.json()
+                    return self._loads(body)
                 except Exception:
-                    return {"raw": text}
+                    return {"raw": self._text(body)}
         raise RuntimeError("خطا در بروزرسانی کاربر پس از تلاش مجدد")
 
     async def _reset_usage(self, username: str) -> None:
         url = f"{self.address}/api/user/{username}/reset"
         for attempt in range(2):
             headers = await self._auth_headers()
-            async with self.session.post(url, headers=headers) as r:
+            started = time.perf_counter()
+            async with self.limiter.slot() as slot, self.session.post(url, headers=headers) as r:
+                slot.overloaded = r.status >= 500
+                self._trace("POST", url, r.status, started)
                 if r.status == 401 and attempt == 0:
                     self._token = None
                     continue
                 if r.status not in (200, 204):
-                    text = await r.text()
-                    raise RuntimeError(f"خطا در ریست مصرف ({r.status}): {text}")
+                    body = await r.read()
+                    raise RuntimeError(f"خطا در ریست مصرف ({r.status}): {self._text(body)}")
                 return
         raise RuntimeError("خطا در ریست مصرف پس از تلاش مجدد")
 
@@ -109,24 +175,22 @@ class MarzbanRenewService:
         - اگر نبود: پیام فارسی «این کاربر وجود ندارد.»
         - اگر بود: expire = now + 31d (ثانیه)، status=active، reset usage
         """
-        user = await self._get_user(username)
-        if user is None:
+        if await self._get_user(username, decode=False) is None:
             return {"ok": False, "message": "این کاربر وجود ندارد."}
 
         new_expire = self._expire_in_31_days_seconds()
 
         # 1) تنظیم expire دقیقاً برای ۳۱ روز آینده + Active
-        await self._modify_user(username, expire=new_expire, status="active")
+        # پاسخ PUT خودِ کاربر به‌روزشده است؛ دیگر GET نهایی لازم نیست
+        updated = await self._modify_user(username, expire=new_expire, status="active")
 
         # 2) ریست حجم مصرفی
         await self._reset_usage(username)
 
-        # 3) وضعیت نهایی
-        latest = await self._get_user(username)
         return {
             "ok": True,
             "message": "تمدید با موفقیت انجام شد: ۳۱ روزه + ریست حجم + اکتیوسازی.",
-            "user": (latest or {}).get("username", username),
+            "user": (updated or {}).get("username", username),
             "expire": new_expire,
         }
 
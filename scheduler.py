@@ -0,0 +1,107 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# حداکثر خواب بین دو بررسی؛ برای جبران تغییر ساعت سیستم
+MAX_SLEEP_S = 300.0
+
+
+class RenewScheduler:
+    """
+    زمان‌بند درون‌پروسه‌ای تمدید خودکار.
+
+    یک min-heap از (due_ts, sub_id) نگه می‌دارد که هنگام شروع از ایندکس
+    دیتابیس (load_index) ساخته می‌شود؛ بنابراین هیچ‌وقت کل جدول poll نمی‌شود.
+    آیتم‌های سررسیده دسته‌ای (batch_size) برداشته می‌شوند، با load_batch از
+    دیتابیس خوانده می‌شوند و renew با حداکثر concurrency اجرای هم‌زمان روی
+    آن‌ها اجرا می‌شود. renew زمان سررسید بعدی را برمی‌گرداند (یا None برای حذف).
+    """
+
+    def __init__(
+        self,
+        load_index: Callable[[], Iterable[Tuple[float, int]]],
+        load_batch: Callable[[List[int]], Iterable[Tuple[int, Any]]],
+        renew: Callable[[int, Any], Awaitable[Optional[float]]],
+        batch_size: int = 100,
+        concurrency: int = 8,
+        retry_s: float = 900.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._load_index = load_index
+        self._load_batch = load_batch
+        self._renew = renew
+        self.batch_size = batch_size
+        self.retry_s = retry_s
+        self._clock = clock
+        self._sem = asyncio.Semaphore(concurrency)
+        self._heap: List[Tuple[float, int]] = []
+        # سررسید معتبر هر اشتراک؛ آیتم‌های قدیمی heap با این مقایسه کنار گذاشته می‌شوند
+        self._due: Dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, sub_id: int, due_ts: float) -> None:
+        self._due[sub_id] = due_ts
+        heapq.heappush(self._heap, (due_ts, sub_id))
+        if self._heap[0] == (due_ts, sub_id):
+            self._wakeup.set()
+
+    def cancel(self, sub_id: int) -> None:
+        # حذف تنبل: آیتم heap هنگام pop نادیده گرفته می‌شود
+        self._due.pop(sub_id, None)
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def rebuild(self) -> None:
+        self._due = {sub_id: float(due) for due, sub_id in self._load_index()}
+        self._heap = [(due, sub_id) for sub_id, due in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def pop_due(self, now: float) -> List[int]:
+        batch: List[int] = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            due, sub_id = heapq.heappop(self._heap)
+            if self._due.get(sub_id) != due:
+                continue
+            del self._due[sub_id]
+            batch.append(sub_id)
+        return batch
+
+    async def _run_one(self, sub_id: int, payload: Any) -> None:
+        async with self._sem:
+            try:
+                next_due = await self._renew(sub_id, payload)
+            except Exception:
+                log.exception("auto-renew of subscription %s failed", sub_id)
+                next_due = self._clock() + self.retry_s
+        if next_due is not None and sub_id not in self._due:
+            self.schedule(sub_id, next_due)
+
+    async def run_batch(self, batch: List[int]) -> None:
+        rows = list(self._load_batch(batch))
+        await asyncio.gather(*(self._run_one(sub_id, payload) for sub_id, payload in rows))
+
+    async def run(self) -> None:
+        self.rebuild()
+        log.info("auto-renew scheduler started with %d subscriptions", len(self._due))
+        while True:
+            self._wakeup.clear()
+            batch = self.pop_due(self._clock())
+            if batch:
+                await self.run_batch(batch)
+                continue
+            due = self.next_due()
+            timeout = MAX_SLEEP_S if due is None else min(max(due - self._clock(), 0.0), MAX_SLEEP_S)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+# Ensure the project root and the shared stubs are importable
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+# bot.py reads its configuration at import time
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:TEST-token")
+os.environ.setdefault("SUPERADMIN_IDS", "1")
+os.environ.setdefault("MARZBAN_ADDRESS", "http://127.0.0.1:1")
+os.environ.setdefault("MARZBAN_USERNAME", "admin")
+os.environ.setdefault("MARZBAN_PASSWORD", "pass")
+
+from stubs import RecordingBot, make_update  # noqa: E402,F401
+
+
+class FakeClock:
+    """Callable clock for code that takes clock=...; tests move it by setting now."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def botmod(tmp_path, monkeypatch):
+    import bot
+    monkeypatch.setattr(bot, "DB_PATH", str(tmp_path / "bot.db"))
+    bot.init_db()
+    return bot
+
+
+@pytest.fixture
+def tg_bot(botmod):
+    """RecordingBot installed as the current Bot, as handlers and background tasks expect."""
+    bot = RecordingBot()
+    botmod.Bot.set_current(bot)
+    return bot
@@ -0,0 +1,128 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import closing
+
+import pytest
+
+from conftest import make_update
+
+
+class FakeService:
+    def __init__(self, result, expire=0):
+        self.result = result
+        self.expire = expire  # انقضای فعلی کاربر روی پنل
+        self.renewed = []
+
+    async def get_user(self, username):
+        return {"username": username, "expire": self.expire}
+
+    async def renew_user_31d(self, username):
+        self.renewed.append(username)
+        await asyncio.sleep(0)  # مثل پنل واقعی، بقیهٔ دسته در این فاصله اجرا می‌شوند
+        if isinstance(self.result, Exception):
+            raise self.result
+        if self.result.get("ok"):
+            self.expire = self.result["expire"]
+        return self.result
+
+
+def _ledger_reasons(botmod, tid):
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn:
+        return [r for (r,) in conn.execute(
+            "SELECT reason FROM credit_ledger WHERE telegram_id=? AND reason != 'set' ORDER BY id", (tid,)
+        )]
+
+
+@pytest.mark.asyncio
+async def test_auto_renew_debits_and_reschedules(botmod, tg_bot, monkeypatch):
+    svc = FakeService({"ok": True, "message": "ok", "expire": 2_000_000})
+    monkeypatch.setattr(botmod, "_svc", svc)
+    botmod.set_credits(42, 2)
+    sub_id = botmod.upsert_subscription(42, "alice", 100)
+
+    next_due = await botmod.auto_renew(sub_id, (42, "alice"))
+
+    assert svc.renewed == ["alice"]
+    assert next_due == 2_000_000 - botmod.AUTO_RENEW_LEAD_S
+    assert botmod.get_credits(42) == 1
+    assert botmod.subscription_due_index() == [(next_due, sub_id)]
+    assert any(data["chat_id"] == 42 for _, data in tg_bot.calls)
+
+
+@pytest.mark.asyncio
+async def test_auto_renew_without_credit_disables(botmod, tg_bot, monkeypatch):
+    svc = FakeService({"ok": True, "message": "ok", "expire": 2_000_000})
+    monkeypatch.setattr(botmod, "_svc", svc)
+    botmod.ensure_customer(43)
+    sub_id = botmod.upsert_subscription(43, "bob", 100)
+
+    assert await botmod.auto_renew(sub_id, (43, "bob")) is None
+    assert svc.renewed == []
+    assert botmod.subscription_due_index() == []
+    assert botmod.load_subscriptions([sub_id]) == []
+
+
+@pytest.mark.asyncio
+async def test_one_credit_renews_only_one_of_concurrent_subscriptions(botmod, tg_bot, monkeypatch):
+    svc = FakeService({"ok": True, "message": "ok", "expire": 2_000_000})
+    monkeypatch.setattr(botmod, "_svc", svc)
+    botmod.set_credits(44, 1)
+    sub_ids = [botmod.upsert_subscription(44, name, 100) for name in ("a", "b", "c")]
+    scheduler = botmod.make_scheduler()
+
+    await scheduler.run_batch(sub_ids)
+
+    assert len(svc.renewed) == 1
+    assert botmod.get_credits(44) == 0
+    assert len(botmod.subscription_due_index()) == 1
+    assert _ledger_reasons(botmod, 44) == ["auto_renew"]
+
+
+@pytest.mark.asyncio
+async def test_failed_renewal_refunds_credit(botmod, tg_bot, monkeypatch):
+    monkeypatch.setattr(botmod, "_svc", FakeService(RuntimeError("panel down")))
+    botmod.set_credits(45, 1)
+    sub_id = botmod.upsert_subscription(45, "dave", 100)
+    assert await botmod.auto_renew(sub_id, (45, "dave")) > 100
+    assert botmod.get_credits(45) == 1
+
+    monkeypatch.setattr(botmod, "_svc", FakeService({"ok": False, "message": "این کاربر وجود ندارد."}))
+    assert await botmod.auto_renew(sub_id, (45, "dave")) is None
+    assert botmod.get_credits(45) == 1
+    assert _ledger_reasons(botmod, 45) == ["auto_renew", "auto_renew_refund"] * 2
+
+
+@pytest.mark.asyncio
+async def test_manual_renew_postpones_auto_renew(botmod, tg_bot, monkeypatch):
+    expire = int(time.time()) + 31 * 86400
+    svc = FakeService({"ok": True, "message": "ok", "expire": expire})
+    monkeypatch.setattr(botmod, "_svc", svc)
+    botmod.set_credits(46, 2)
+    sub_id = botmod.upsert_subscription(46, "erin", 100)
+    dp = botmod.build_dispatcher(tg_bot)
+    botmod.Dispatcher.set_current(dp)
+
+    await dp.process_updates([make_update(46, "🔁 تمدید کاربر")])
+    await dp.process_updates([make_update(46, "erin")])
+    assert botmod.get_credits(46) == 1
+    assert botmod.subscription_due_index() == [(expire - botmod.AUTO_RENEW_LEAD_S, sub_id)]
+
+    # زمان قدیمی در heap مانده بود و زمان‌بند اجرا می‌شود
+    assert await botmod.auto_renew(sub_id, (46, "erin")) == expire - botmod.AUTO_RENEW_LEAD_S
+    assert svc.renewed == ["erin"]
+    assert botmod.get_credits(46) == 1
+
+
+@pytest.mark.asyncio
+async def test_renewal_done_on_panel_is_not_charged_again(botmod, tg_bot, monkeypatch):
+    expire = int(time.time()) + 31 * 86400
+    svc = FakeService({"ok": True, "message": "ok", "expire": 2_000_000}, expire=expire)
+    monkeypatch.setattr(botmod, "_svc", svc)
+    botmod.set_credits(47, 1)
+    sub_id = botmod.upsert_subscription(47, "frank", 100)
+
+    assert await botmod.auto_renew(sub_id, (47, "frank")) == expire - botmod.AUTO_RENEW_LEAD_S
+    assert svc.renewed == []
+    assert botmod.get_credits(47) == 1
+    assert botmod.subscription_due_index() == [(expire - botmod.AUTO_RENEW_LEAD_S, sub_id)]
@@ -0,0 +1,105 @@
+import asyncio
+import gzip
+import os
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import backup
+from conftest import FakeClock, make_update
+
+
+def _restore(gz_path, dest):
+    with gzip.open(gz_path, "rb") as fin, open(dest, "wb") as fout:
+        fout.write(fin.read())
+    return dest
+
+
+def test_snapshot_is_consistent_copy(botmod, tmp_path):
+    for tid in range(1, 301):
+        botmod.add_credits(tid, tid)
+    out_dir = tmp_path / "backups"
+    path = backup.snapshot(botmod.DB_PATH, str(out_dir), pages=2, step_sleep=0)
+
+    assert os.path.basename(path).startswith("bot-") and path.endswith(".db.gz")
+    assert os.listdir(out_dir) == [os.path.basename(path)]
+    restored = _restore(path, tmp_path / "restored.db")
+    with closing(sqlite3.connect(restored)) as conn:
+        assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        assert conn.execute("SELECT COUNT(*), SUM(credits) FROM customers").fetchone() == (300, 45150)
+
+
+def test_rotation_keeps_newest(tmp_path):
+    db = tmp_path / "bot.db"
+    sqlite3.connect(db).close()
+    out_dir = tmp_path / "backups"
+    out_dir.mkdir()
+    for day in range(1, 6):
+        (out_dir / f"bot-202401{day:02d}-000000.db.gz").write_bytes(b"")
+    # نسخه‌های برندهای دیگر جدا شمرده می‌شوند
+    (out_dir / "bot-brand-20240101-000000.db.gz").write_bytes(b"")
+
+    newest = backup.snapshot(str(db), str(out_dir), keep=3)
+
+    assert backup.list_snapshots(str(db), str(out_dir)) == [
+        str(out_dir / "bot-20240104-000000.db.gz"),
+        str(out_dir / "bot-20240105-000000.db.gz"),
+        newest,
+    ]
+    assert (out_dir / "bot-brand-20240101-000000.db.gz").exists()
+
+
+@pytest.mark.asyncio
+async def test_backup_command_sends_file(botmod, tg_bot, tmp_path, monkeypatch):
+    monkeypatch.setattr(botmod, "BACKUP_DIR", str(tmp_path / "backups"))
+    monkeypatch.setattr(botmod, "_backups", {})
+    bot = tg_bot
+    dp = botmod.build_dispatcher(bot)
+    botmod.Dispatcher.set_current(dp)
+
+    botmod.add_admin(2)
+    await dp.process_updates([make_update(2, "/backup")])
+    assert bot.calls[-1][1]["text"] == "فقط سوپرادمین."
+    assert not os.path.exists(tmp_path / "backups")
+
+    await dp.process_updates([make_update(1, "/backup")])
+    method, data = bot.calls[-1]
+    assert method == "sendDocument"
+    assert data["caption"].startswith("💾")
+    assert len(os.listdir(tmp_path / "backups")) == 1
+
+
+def test_next_run_follows_newest_snapshot(tmp_path):
+    db = tmp_path / "bot.db"
+    out_dir = tmp_path / "backups"
+    clock = FakeClock(backup.snapshot_time("bot-20240102-000000.db.gz"))
+    runner = backup.BackupRunner(str(db), str(out_dir), interval_s=6 * 3600, clock=clock)
+    assert runner.next_run() == clock.now  # هنوز نسخه‌ای نیست
+
+    out_dir.mkdir()
+    (out_dir / "bot-20240101-000000.db.gz").write_bytes(b"")
+    (out_dir / "bot-20240101-220000.db.gz").write_bytes(b"")
+    assert runner.next_run() == clock.now + 4 * 3600
+
+
+@pytest.mark.asyncio
+async def test_overdue_backup_runs_at_startup(botmod, tmp_path):
+    out_dir = tmp_path / "backups"
+    out_dir.mkdir()
+    (out_dir / "bot-20240101-000000.db.gz").write_bytes(b"")
+    runner = backup.BackupRunner(botmod.DB_PATH, str(out_dir), interval_s=24 * 3600)
+
+    task = asyncio.create_task(runner.run())
+    try:
+        for _ in range(200):
+            if runner.last_path:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert runner.last_path is not None
+    assert len(backup.list_snapshots(botmod.DB_PATH, str(out_dir))) == 2
+    assert runner.next_run() > runner._clock()
@@ -0,0 +1,120 @@
+import io
+import sqlite3
+from contextlib import closing
+
+import pytest
+from aiogram import types
+
+from conftest import make_update
+
+
+def test_parse_folds_ops_per_customer(botmod):
+    fh = io.StringIO("telegram_id,op,amount\n1,add,5\n2,set,10\n\n1,add,2\n2,add,3\n3,set,4\n3,add,-1\n")
+    ops, rows, errors = botmod.parse_credit_csv(fh)
+    assert errors == []
+    assert rows == 6
+    assert ops == {1: ("add", 7), 2: ("set", 13), 3: ("set", 3)}
+
+
+def test_parse_reports_invalid_rows(botmod):
+    lines = ["1,add,5", "x,add,1", "2,drop,1", "3,set,-1", "4,add"] + ["y,set,1"] * 20
+    ops, rows, errors = botmod.parse_credit_csv(io.StringIO("\n".join(lines)))
+    assert errors[0] == "خط 2: x,add,1"
+    assert len(errors) == botmod.CREDIT_IMPORT_MAX_ERRORS + 1
+    assert errors[-1].startswith("...")
+
+
+def test_import_applies_in_one_transaction(botmod, tmp_path):
+    botmod.add_credits(1, 4)
+    botmod.add_credits(2, 9)
+    path = tmp_path / "credits.csv"
+    rows = ["1,add,3", "2,set,9", "3,set,6"] + [f"{1000 + i},add,1" for i in range(2000)]
+    path.write_text("\n".join(rows), encoding="utf-8")
+
+    summary, count, errors = botmod.import_credits_csv(str(path), actor_id=77)
+
+    assert errors == [] and count == 2003
+    assert summary == {"customers": 2003, "created": 2001, "changed": 2002}
+    assert (botmod.get_credits(1), botmod.get_credits(2), botmod.get_credits(3)) == (7, 9, 6)
+    assert botmod.get_credits(2999) == 1
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn:
+        ledger = conn.execute(
+            "SELECT telegram_id, delta, balance_after, actor_id FROM credit_ledger WHERE reason='import' AND telegram_id < 10 ORDER BY telegram_id"
+        ).fetchall()
+        assert ledger == [(1, 3, 7, 77), (3, 6, 6, 77)]
+        # جمع دفتر با مانده‌ها یکی است
+        total_ledger, total_credits = conn.execute(
+            "SELECT (SELECT SUM(delta) FROM credit_ledger), (SELECT SUM(credits) FROM customers)"
+        ).fetchone()
+        assert total_ledger == total_credits
+
+
+def test_import_with_errors_changes_nothing(botmod, tmp_path):
+    path = tmp_path / "credits.csv"
+    path.write_text("1,set,5\n2,set,oops\n", encoding="utf-8")
+    summary, count, errors = botmod.import_credits_csv(str(path))
+    assert summary is None
+    assert errors == ["خط 2: 2,set,oops"]
+    assert botmod.get_credits(1) == 0  # هیچ ردیفی اعمال نشد
+
+
+def test_header_after_blank_lines(botmod):
+    fh = io.StringIO("\n\ntelegram_id,op,amount\n1,add,5\n")
+    ops, rows, errors = botmod.parse_credit_csv(fh)
+    assert errors == [] and rows == 1
+    assert ops == {1: ("add", 5)}
+
+
+def test_combined_set_must_not_be_negative(botmod, tmp_path):
+    path = tmp_path / "credits.csv"
+    path.write_text("1,set,0\n1,add,-5\n2,set,3\n", encoding="utf-8")
+    summary, _, errors = botmod.import_credits_csv(str(path))
+    assert summary is None
+    assert errors == ["مشتری 1: ماندهٔ نهایی منفی (-5)"]
+    assert not botmod.is_customer(1) and not botmod.is_customer(2)
+
+
+def test_negative_add_below_balance_rolls_back(botmod, tmp_path):
+    botmod.add_credits(1, 3)
+    botmod.add_credits(2, 10)
+    path = tmp_path / "credits.csv"
+    path.write_text("2,add,-4\n1,add,-5\n3,set,7\n", encoding="utf-8")
+    summary, _, errors = botmod.import_credits_csv(str(path))
+    assert summary is None
+    assert errors == ["مشتری 1: ماندهٔ نهایی منفی (-2)"]
+    assert (botmod.get_credits(1), botmod.get_credits(2)) == (3, 10)
+    assert not botmod.is_customer(3)
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM credit_ledger WHERE reason='import'").fetchone() == (0,)
+
+
+def test_unrelated_negative_balance_does_not_block_import(botmod, tmp_path):
+    botmod.set_credits(99, -2)
+    botmod.add_credits(1, 5)
+    path = tmp_path / "credits.csv"
+    path.write_text("1,add,-3\n", encoding="utf-8")
+    summary, _, errors = botmod.import_credits_csv(str(path))
+    assert errors == []
+    assert summary["changed"] == 1
+    assert botmod.get_credits(1) == 2
+
+
+@pytest.mark.asyncio
+async def test_unreadable_csv_gets_a_reply(botmod, tg_bot, monkeypatch):
+    async def download(self, destination_file=None, **kwargs):
+        with open(destination_file, "wb") as fh:
+            # فیلدی بزرگ‌تر از csv.field_size_limit() باعث csv.Error می‌شود
+            fh.write(b'1,add,5\n"' + b"x" * 200_000 + b'",add,1\n')
+
+    monkeypatch.setattr(types.Document, "download", download)
+    dp = botmod.build_dispatcher(tg_bot)
+    botmod.Dispatcher.set_current(dp)
+    await dp.process_updates([make_update(1, "📥 ورود اعتبار از CSV")])
+
+    update = make_update(1, "")
+    update.message.text = None
+    update.message.document = types.Document(file_id="f", file_unique_id="u", file_name="c.csv", file_size=200_020)
+    await dp.process_updates([update])
+
+    assert "CSV خوانا نیست" in tg_bot.calls[-1][1]["text"]
+    assert botmod.get_credits(1) == 0  # هیچ ردیفی اعمال نشد
@@ -0,0 +1,87 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pytest
+
+
+def _ledger(botmod, tid):
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn:
+        return conn.execute(
+            "SELECT delta, balance_after, reason, actor_id, log_id FROM credit_ledger WHERE telegram_id=? ORDER BY id",
+            (tid,),
+        ).fetchall()
+
+
+def test_balance_changes_are_recorded(botmod):
+    botmod.add_credits(7, 10, actor_id=1)
+    botmod.set_credits(7, 4, actor_id=1)
+    botmod.set_credits(7, 4, actor_id=1)  # بدون تغییر، بدون سطر
+    ledger_id = botmod.dec_credit(7, "renew", 7)
+    log_id = botmod.log_action(7, "u", "alice", True, "ok", ledger_id)
+
+    assert botmod.get_credits(7) == 3
+    assert _ledger(botmod, 7) == [
+        (10, 10, "add", 1, None),
+        (-6, 4, "set", 1, None),
+        (-1, 3, "renew", 7, log_id),
+    ]
+
+
+def test_dec_credit_without_balance(botmod):
+    botmod.ensure_customer(8)
+    assert botmod.dec_credit(8) is None
+    assert _ledger(botmod, 8) == []
+
+
+def test_remove_customer_closes_balance(botmod):
+    botmod.add_credits(9, 5)
+    botmod.remove_customer(9, actor_id=1)
+    assert [row[:3] for row in _ledger(botmod, 9)] == [(5, 5, "add"), (-5, 0, "remove")]
+
+
+def test_ledger_is_append_only(botmod):
+    botmod.add_credits(7, 1)
+    log_id = botmod.log_action(7, "u", "x", True, "ok", 1)
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn:
+        with pytest.raises(sqlite3.DatabaseError):
+            conn.execute("UPDATE credit_ledger SET delta = 100")
+        with pytest.raises(sqlite3.DatabaseError):
+            conn.execute("DELETE FROM credit_ledger")
+        with pytest.raises(sqlite3.DatabaseError):
+            conn.execute("UPDATE credit_ledger SET log_id = ?", (log_id + 1,))
+
+
+def test_statement_for_period(botmod):
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn, conn:
+        conn.execute("INSERT INTO customers (telegram_id, credits) VALUES (5, 0)")
+        for ts, delta in [("2024-01-05T10:00:00", 10), ("2024-02-01T10:00:00", -1),
+                          ("2024-02-20T10:00:00", 5), ("2024-03-01T00:00:00", -2)]:
+            conn.execute("UPDATE customers SET credits = credits + ? WHERE telegram_id=5", (delta,))
+            conn.execute(
+                "INSERT INTO credit_ledger (ts_utc, telegram_id, delta, balance_after, reason) "
+                "SELECT ?, 5, ?, credits, 'test' FROM customers WHERE telegram_id=5",
+                (ts, delta),
+            )
+    opening, closing_balance, credit_in, credit_out, count, rows = botmod.credit_statement(
+        5, datetime(2024, 2, 1), datetime(2024, 2, 29)
+    )
+    assert (opening, closing_balance, credit_in, credit_out, count) == (10, 14, 5, 1, 2)
+    assert [r[1] for r in rows] == [-1, 5]
+    assert botmod.credit_statement(5)[:5] == (0, 12, 15, 3, 4)
+
+
+def test_opening_rows_for_existing_balances(botmod):
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn, conn:
+        conn.execute("INSERT INTO customers (telegram_id, credits) VALUES (11, 6), (12, 0)")
+    botmod.init_db()
+    botmod.init_db()
+    assert _ledger(botmod, 11) == [(6, 6, "opening", None, None)]
+    assert _ledger(botmod, 12) == []
+
+
+def test_parse_statement_args(botmod):
+    assert botmod.parse_statement_args("42") == (42, None, None)
+    assert botmod.parse_statement_args("42 2024-01-01") == (42, datetime(2024, 1, 1), None)
+    with pytest.raises(ValueError):
+        botmod.parse_statement_args("")
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from checkpoint import WalCheckpointer
+from conftest import FakeClock
+
+
+def test_connections_get_pragma_profile(botmod):
+    conn = botmod.connect()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        assert conn.execute("PRAGMA synchronous").fetchone() == (1,)  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone() == (5000,)
+        assert conn.execute("PRAGMA cache_size").fetchone() == (-8000,)
+        assert conn.execute("PRAGMA temp_store").fetchone() == (2,)  # MEMORY
+    finally:
+        conn.close()
+
+
+def test_helpers_use_connection_factory(botmod, monkeypatch):
+    opened = []
+    real = botmod.connect
+
+    def spy(*args, **kwargs):
+        conn = real(*args, **kwargs)
+        opened.append(conn.execute("PRAGMA synchronous").fetchone()[0])
+        return conn
+
+    monkeypatch.setattr(botmod, "connect", spy)
+    monkeypatch.setattr(botmod, "SQLITE_PRAGMAS", {**botmod.DEFAULT_PRAGMAS, "synchronous": "FULL"})
+    botmod.add_credits(7, 3)
+    botmod.log_action(7, "u", "alice", True, "ok")
+    assert botmod.get_credits(7) == 3
+    assert opened and set(opened) == {2}  # FULL
+
+
+def test_pragmas_from_env(botmod, monkeypatch):
+    monkeypatch.setenv("SQLITE_PRAGMAS", "synchronous=FULL, cache_size=-32000")
+    pragmas = botmod._pragmas_from_env("SQLITE_PRAGMAS")
+    assert pragmas["synchronous"] == "FULL"
+    assert pragmas["cache_size"] == "-32000"
+    assert pragmas["busy_timeout"] == botmod.DEFAULT_PRAGMAS["busy_timeout"]
+    monkeypatch.setenv("SQLITE_PRAGMAS", "synchronous=OFF; DROP TABLE logs")
+    with pytest.raises(RuntimeError):
+        botmod._pragmas_from_env("SQLITE_PRAGMAS")
+
+
+def test_checkpointer_passive_then_truncate_when_idle(botmod):
+    clock = FakeClock()
+    checkpointer = WalCheckpointer(botmod.DB_PATH, botmod.connect, idle_s=300, clock=clock)
+    checkpointer.open()
+    try:
+        for tid in range(50):
+            botmod.add_credits(tid, 1)
+        wal = botmod.DB_PATH + "-wal"
+        assert os.path.getsize(wal) > 0
+
+        assert checkpointer.tick() == "passive"
+        busy, frames, done = checkpointer.last
+        assert busy == 0 and frames == done > 0
+
+        botmod.add_credits(1, 1)
+        clock.now = 200
+        assert checkpointer.tick() == "passive"  # WAL تازه تغییر کرده
+        clock.now = 600
+        assert checkpointer.tick() == "truncate"
+        assert os.path.getsize(wal) == 0
+        assert checkpointer.tick() == "none"
+    finally:
+        checkpointer.close()
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn:
+        assert conn.execute("SELECT SUM(credits) FROM customers").fetchone() == (51,)
@@ -0,0 +1,75 @@
+import csv
+import gzip
+from datetime import datetime
+
+import pytest
+
+from conftest import make_update
+
+
+def _insert_log(botmod, ts, actor_id, target):
+    import sqlite3
+    from contextlib import closing
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn, conn:
+        conn.execute(
+            "INSERT INTO logs (ts_utc, actor_id, actor_username, target_marzban_username, success, message) VALUES (?,?,?,?,?,?)",
+            (ts, actor_id, "u", target, 1, "ok"),
+        )
+
+
+def _read(path):
+    with gzip.open(path, "rt", encoding="utf-8-sig", newline="") as fh:
+        return list(csv.reader(fh))
+
+
+def test_export_all_rows(botmod, tmp_path):
+    for i in range(1200):
+        _insert_log(botmod, f"2024-01-{1 + i % 28:02d}T10:00:00", 10 + i % 2, f"user{i}")
+    out = tmp_path / "logs.csv.gz"
+    count = botmod.export_logs_csv(str(out))
+    rows = _read(out)
+    assert count == 1200
+    assert rows[0] == list(botmod.LOG_EXPORT_COLUMNS)
+    assert len(rows) == 1201
+    assert rows[1][4] == "user0"
+
+
+def test_export_filters(botmod, tmp_path):
+    _insert_log(botmod, "2024-01-01T00:00:00", 10, "a")
+    _insert_log(botmod, "2024-01-15T23:59:59", 10, "b")
+    _insert_log(botmod, "2024-01-15T12:00:00", 11, "c")
+    _insert_log(botmod, "2024-01-16T00:00:00", 10, "d")
+    out = tmp_path / "logs.csv.gz"
+    count = botmod.export_logs_csv(
+        str(out), datetime(2024, 1, 10), datetime(2024, 1, 15), 10
+    )
+    assert count == 1
+    assert [r[4] for r in _read(out)[1:]] == ["b"]
+
+
+def test_parse_filters(botmod):
+    assert botmod.parse_log_export_filters("-") == (None, None, None)
+    assert botmod.parse_log_export_filters("- - 42") == (None, None, 42)
+    assert botmod.parse_log_export_filters("2024-02-01 2024-02-29") == (
+        datetime(2024, 2, 1), datetime(2024, 2, 29), None
+    )
+    with pytest.raises(ValueError):
+        botmod.parse_log_export_filters("2024-13-01")
+    with pytest.raises(ValueError):
+        botmod.parse_log_export_filters("- - x")
+
+
+@pytest.mark.asyncio
+async def test_oversized_export_is_not_uploaded(botmod, tg_bot, monkeypatch):
+    _insert_log(botmod, "2024-01-01T00:00:00", 10, "a")
+    monkeypatch.setattr(botmod, "TELEGRAM_UPLOAD_LIMIT", 10)
+    dp = botmod.build_dispatcher(tg_bot)
+    botmod.Dispatcher.set_current(dp)
+
+    await dp.process_updates([make_update(1, "📤 خروجی لاگ‌ها")])
+    await dp.process_updates([make_update(1, "-")])
+
+    method, data = tg_bot.calls[-1]
+    assert method == "sendMessage"
+    assert "بازهٔ تاریخ کوتاه‌تری" in data["text"]
+    assert all(method != "sendDocument" for method, _ in tg_bot.calls)
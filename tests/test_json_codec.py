@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from renew_service import MarzbanRenewService, default_json_codec
+
+
+async def _token(request):
+    return web.json_response({"access_token": "t"})
+
+
+async def _start_panel(routes):
+    app = web.Application()
+    app.router.add_post("/api/admin/token", _token)
+    for method, path, handler in routes:
+        app.router.add_route(method, path, handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_renew_decodes_each_body_once():
+    calls = []
+
+    async def get_user(request):
+        calls.append("get")
+        return web.json_response({"username": "alice", "proxies": {"vless": {}}, "links": ["x"] * 50})
+
+    async def put_user(request):
+        calls.append("put")
+        body = await request.json()
+        assert request.headers["Content-Type"] == "application/json"
+        assert body["status"] == "active"
+        return web.json_response({"username": "alice", **body})
+
+    async def reset(request):
+        calls.append("reset")
+        return web.Response(status=200)
+
+    server = await _start_panel([
+        ("GET", "/api/user/alice", get_user),
+        ("PUT", "/api/user/alice", put_user),
+        ("POST", "/api/user/alice/reset", reset),
+    ])
+    decoded = []
+
+    def loads(body):
+        decoded.append(body)
+        return json.loads(body)
+
+    svc = MarzbanRenewService(str(server.make_url('/')), 'admin', 'pass', json_loads=loads)
+    try:
+        res = await svc.renew_user_31d('alice')
+        assert res["ok"] is True
+        assert res["user"] == "alice"
+        assert calls == ["get", "put", "reset"]
+        # فقط توکن و پاسخ PUT decode می‌شوند؛ بدنهٔ سنگین GET نه
+        assert len(decoded) == 2
+    finally:
+        await svc.close()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_get_user_missing():
+    async def get_user(request):
+        return web.Response(status=404)
+
+    server = await _start_panel([("GET", "/api/user/bob", get_user)])
+    svc = MarzbanRenewService(str(server.make_url('/')), 'admin', 'pass')
+    try:
+        assert await svc._get_user('bob', decode=False) is None
+        assert await svc.get_user('bob') is None
+        res = await svc.renew_user_31d('bob')
+        assert res["ok"] is False
+    finally:
+        await svc.close()
+        await server.close()
+
+
+def test_default_codec_roundtrip():
+    loads, dumps = default_json_codec()
+    payload = dumps({"expire": 123, "status": "active"})
+    assert isinstance(payload, bytes)
+    assert loads(payload) == {"expire": 123, "status": "active"}
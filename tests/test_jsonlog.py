@@ -0,0 +1,102 @@
+import io
+import json
+import logging
+import sqlite3
+from contextlib import closing
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from jsonlog import correlation, current_correlation_id, setup_logging, traced
+from renew_service import MarzbanRenewService
+
+
+@pytest.fixture
+def json_logs():
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    stream = io.StringIO()
+    listener = setup_logging(logging.INFO, stream)
+
+    def read():
+        if listener._thread is not None:
+            listener.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield read
+    read()
+    root.handlers[:] = saved[0]
+    root.setLevel(saved[1])
+
+
+def test_records_are_json_with_correlation_id(json_logs):
+    log = logging.getLogger("test.jsonlog")
+    with correlation("abc123") as cid:
+        assert cid == current_correlation_id() == "abc123"
+        log.info("renewed %s", "alice", extra={"elapsed_ms": 12.5})
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            log.exception("boom")
+    log.warning("outside")
+
+    first, second, third = json_logs()
+    assert first["msg"] == "renewed alice"
+    assert first["correlation_id"] == "abc123"
+    assert first["elapsed_ms"] == 12.5
+    assert first["logger"] == "test.jsonlog"
+    assert "ZeroDivisionError" in second["exc"]
+    assert "correlation_id" not in third and third["level"] == "WARNING"
+
+
+@pytest.mark.asyncio
+async def test_traced_gives_each_call_its_own_id():
+    @traced
+    async def work():
+        return current_correlation_id()
+
+    a, b = await work(), await work()
+    assert a and b and a != b
+    assert current_correlation_id() is None
+
+
+@pytest.mark.asyncio
+async def test_correlation_id_reaches_panel_and_logs_row(botmod, tg_bot, json_logs, monkeypatch):
+    seen = []
+
+    async def token(request):
+        return web.json_response({"access_token": "t"})
+
+    async def user(request):
+        seen.append(request.headers.get("X-Request-ID"))
+        return web.json_response({"username": "alice"})
+
+    async def reset(request):
+        seen.append(request.headers.get("X-Request-ID"))
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post("/api/admin/token", token)
+    app.router.add_get("/api/user/alice", user)
+    app.router.add_put("/api/user/alice", user)
+    app.router.add_post("/api/user/alice/reset", reset)
+    server = TestServer(app)
+    await server.start_server()
+    svc = MarzbanRenewService(str(server.make_url("")), "admin", "pass")
+    monkeypatch.setattr(botmod, "_svc", svc)
+
+    botmod.set_credits(42, 1)
+    sub_id = botmod.upsert_subscription(42, "alice", 100)
+    try:
+        await botmod.auto_renew(sub_id, (42, "alice"))
+    finally:
+        await svc.close()
+        await server.close()
+
+    with closing(sqlite3.connect(botmod.DB_PATH)) as conn:
+        (cid,) = conn.execute("SELECT correlation_id FROM logs").fetchone()
+    assert cid and seen == [cid] * 4  # انقضای فعلی + سه درخواست تمدید
+    records = [r for r in json_logs() if r.get("correlation_id") == cid]
+    assert [r["status"] for r in records if r["logger"] == "renew_service"] == [200] * 4
+    assert any(r.get("log_id") == 1 and r["success"] for r in records)
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from conftest import FakeClock
+from limiter import AdaptiveLimiter
+from renew_service import MarzbanRenewService
+
+
+async def _fill(limiter, n):
+    for _ in range(n):
+        await limiter.acquire()
+
+
+@pytest.mark.asyncio
+async def test_grows_while_latency_is_healthy():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(initial=2, max_limit=5, clock=clock)
+    for _ in range(50):
+        await _fill(limiter, limiter.limit)
+        for _ in range(limiter.limit):
+            limiter.release(0.1)
+    assert limiter.limit == 5
+
+
+@pytest.mark.asyncio
+async def test_shrinks_on_overload_and_high_latency():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(initial=16, clock=clock)
+    await _fill(limiter, 3)
+    limiter.release(0.1)
+    limiter.release(0.1, overloaded=True)
+    assert limiter.limit == 8
+    # چند خطای پشت سر هم در یک رفت‌وبرگشت فقط یک بار پنجره را کوچک می‌کنند
+    limiter.release(0.1, overloaded=True)
+    assert limiter.limit == 8
+    clock.now = 1.0
+    await limiter.acquire()
+    limiter.release(5.0)
+    assert limiter.limit == 4
+
+
+@pytest.mark.asyncio
+async def test_queue_is_fifo_and_respects_limit():
+    limiter = AdaptiveLimiter(initial=2, max_limit=2)
+    order = []
+    running = 0
+    peak = 0
+
+    async def work(i):
+        nonlocal running, peak
+        async with limiter.slot():
+            order.append(i)
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(work(i) for i in range(8)))
+    assert order == list(range(8))
+    assert peak == 2
+    assert limiter.inflight == 0 and limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.queued == 1
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.queued == 0
+    limiter.release(0.1)
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_panel_5xx_shrinks_service_window():
+    async def token_handler(request):
+        return web.json_response({"access_token": "t"})
+
+    async def reset_handler(request):
+        return web.Response(status=503)
+
+    app = web.Application()
+    app.router.add_post("/api/admin/token", token_handler)
+    app.router.add_post("/api/user/alice/reset", reset_handler)
+    server = TestServer(app)
+    await server.start_server()
+    svc = MarzbanRenewService(str(server.make_url('/')), 'admin', 'pass', limiter=AdaptiveLimiter(initial=8))
+    try:
+        with pytest.raises(RuntimeError):
+            await svc._reset_usage('alice')
+        assert svc.limiter.limit == 4
+        assert svc.limiter.inflight == 0
+    finally:
+        await svc.close()
+        await server.close()
@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import RecordingBot, make_update
+
+
+@pytest.mark.asyncio
+async def test_tenants_have_isolated_credits(botmod, tmp_path):
+    class Bot(RecordingBot, botmod.PooledBot):
+        pass
+
+    path_a = str(tmp_path / "bot-a.db")
+    path_b = str(tmp_path / "bot-b.db")
+    for path in (path_a, path_b):
+        with botmod.use_db(path):
+            botmod.init_db()
+    with botmod.use_db(path_a):
+        botmod.set_credits(500, 7)
+    with botmod.use_db(path_b):
+        botmod.set_credits(500, 3)
+
+    bot_a, bot_b = Bot(token="111:aaa"), Bot(token="222:bbb")
+    dp_a = botmod.build_dispatcher(bot_a, path_a)
+    dp_b = botmod.build_dispatcher(bot_b, path_b)
+    # مثل polling، هر Dispatcher در context خودش آپدیت پردازش می‌کند
+    for dp in (dp_a, dp_b):
+        botmod.Bot.set_current(dp.bot)
+        botmod.Dispatcher.set_current(dp)
+        await dp.process_updates([make_update(500, "💳 اعتبار من")])
+
+    assert bot_a.calls[-1][1]["text"].endswith(": 7")
+    assert bot_b.calls[-1][1]["text"].endswith(": 3")
+    assert botmod.get_credits(500) == 0  # DB_PATH اصلی دست نخورده
+
+
+@pytest.mark.asyncio
+async def test_pooled_bots_share_session(botmod):
+    bot_a, bot_b = botmod.PooledBot("111:aaa"), botmod.PooledBot("222:bbb")
+    try:
+        assert await bot_a.get_session() is await bot_b.get_session()
+    finally:
+        await botmod.PooledBot.close_shared_session()
+
+
+def test_tenants_from_env(botmod, monkeypatch):
+    monkeypatch.setenv("TENANT_BOTS", "brand_a=1:aa, brand-b=2:bb")
+    assert botmod._tenants_from_env("TENANT_BOTS") == {"brand_a": "1:aa", "brand-b": "2:bb"}
+    monkeypatch.setenv("TENANT_BOTS", "bad name=1:aa")
+    with pytest.raises(RuntimeError):
+        botmod._tenants_from_env("TENANT_BOTS")
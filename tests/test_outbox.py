@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from aiogram.utils.exceptions import RetryAfter
+
+from conftest import FakeClock
+from outbox import BROADCAST, INTERACTIVE, SendScheduler, TokenBucket, send_priority
+
+
+def test_token_bucket_refill_and_pause():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now = 0.5
+    assert bucket.delay() == 0
+    bucket.pause(3)
+    assert bucket.delay() == pytest.approx(3)
+
+
+@pytest.mark.asyncio
+async def test_interactive_sent_before_broadcast():
+    outbox = SendScheduler(global_rate=1000)
+    outbox._global = TokenBucket(rate=1000, burst=1)  # یک ارسال در هر لحظه
+    sent = []
+
+    async def send(tag):
+        sent.append(tag)
+
+    try:
+        first = asyncio.create_task(outbox.submit(lambda: send("warmup")))
+        await asyncio.sleep(0)
+        with send_priority(BROADCAST):
+            broadcasts = [asyncio.create_task(outbox.submit(lambda i=i: send(f"b{i}"), chat_id=100 + i))
+                          for i in range(3)]
+        await asyncio.sleep(0)
+        reply = asyncio.create_task(outbox.submit(lambda: send("reply"), chat_id=1, priority=INTERACTIVE))
+        await asyncio.gather(first, reply, *broadcasts)
+        assert sent.index("reply") < sent.index("b1")
+        assert outbox.depth == 0
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_per_chat_rate_limit():
+    outbox = SendScheduler(global_rate=1000, per_chat_rate=50, per_chat_burst=1)
+    loop = asyncio.get_running_loop()
+    stamps = []
+
+    async def send():
+        stamps.append(loop.time())
+
+    try:
+        await asyncio.gather(*(outbox.submit(send, chat_id=7) for _ in range(4)))
+        gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+        assert min(gaps) >= 0.015
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured():
+    outbox = SendScheduler(global_rate=1000)
+    calls = 0
+
+    async def send():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RetryAfter(0.05)
+        return "ok"
+
+    try:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await outbox.submit(send, chat_id=3) == "ok"
+        assert calls == 2
+        assert loop.time() - started >= 0.05
+    finally:
+        await outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_pooled_bot_routes_requests_through_outbox(botmod, monkeypatch):
+    calls = []
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        calls.append(method)
+        return {"message_id": 1, "date": 0, "chat": {"id": data["chat_id"], "type": "private"}}
+
+    # سطح پایهٔ aiogram جایگزین می‌شود؛ PooledBot.request همچنان از outbox رد می‌شود
+    monkeypatch.setattr(botmod.Bot, "request", request)
+    bot = botmod.PooledBot("123:abc")
+    try:
+        with send_priority(BROADCAST):
+            await bot.send_message(5, "hi")
+        assert calls == ["sendMessage"]
+        assert 5 in bot.outbox._chats
+    finally:
+        await bot.close()
+
+
+@pytest.mark.asyncio
+async def test_pooled_bot_does_not_resend_consumed_upload(botmod, monkeypatch, tmp_path):
+    sent = []
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        # مثل aiohttp: فایل خوانده و بسته می‌شود
+        fh = files["document"].file
+        sent.append(fh.read())
+        fh.close()
+        raise RetryAfter(0.05)
+
+    monkeypatch.setattr(botmod.Bot, "request", request)
+    path = tmp_path / "backup.db.gz"
+    path.write_bytes(b"snapshot")
+    bot = botmod.PooledBot("123:abc")
+    try:
+        with open(path, "rb") as fh:
+            with pytest.raises(RetryAfter):
+                await bot.send_document(5, botmod.types.InputFile(fh, filename="backup.db.gz"))
+        assert sent == [b"snapshot"]
+        # توقف چت همچنان اعمال می‌شود تا ارسال‌های بعدی منتظر بمانند
+        assert bot.outbox._chats[5].delay() > 0
+    finally:
+        await bot.close()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeClock
+from scheduler import RenewScheduler
+
+
+def make(index, renew, clock, **kwargs):
+    return RenewScheduler(
+        lambda: index,
+        lambda ids: [(sub_id, f"user{sub_id}") for sub_id in ids],
+        renew,
+        clock=clock,
+        **kwargs,
+    )
+
+
+def test_pop_due_in_order_and_batches():
+    clock = FakeClock(1000.0)
+    sched = make([(1005, 3), (990, 1), (1000, 2), (2000, 4)], None, clock, batch_size=2)
+    sched.rebuild()
+    assert sched.pop_due(clock()) == [1, 2]
+    assert sched.pop_due(clock()) == []
+    clock.now = 1010
+    assert sched.pop_due(clock()) == [3]
+    assert sched.next_due() == 2000
+    assert len(sched) == 1
+
+
+def test_reschedule_and_cancel_skip_stale_entries():
+    clock = FakeClock(1000.0)
+    sched = make([(900, 1), (950, 2)], None, clock)
+    sched.rebuild()
+    sched.schedule(1, 5000)  # جابه‌جایی سررسید؛ آیتم قدیمی heap باید نادیده گرفته شود
+    sched.cancel(2)
+    assert sched.pop_due(clock()) == []
+    assert sched.next_due() == 5000
+
+
+@pytest.mark.asyncio
+async def test_run_batch_bounded_concurrency_and_reschedule():
+    clock = FakeClock(1000.0)
+    running = 0
+    peak = 0
+
+    async def renew(sub_id, payload):
+        nonlocal running, peak
+        assert payload == f"user{sub_id}"
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if sub_id == 5:
+            raise RuntimeError("panel down")
+        return None if sub_id == 4 else clock() + 31 * 86400
+
+    sched = make([(999, i) for i in range(10)], renew, clock, concurrency=3, retry_s=60)
+    sched.rebuild()
+    await sched.run_batch(sched.pop_due(clock()))
+    assert peak == 3
+    assert len(sched) == 9  # 4 حذف شد
+    assert sched.next_due() == clock() + 60  # 5 برای تلاش مجدد
+
+
+@pytest.mark.asyncio
+async def test_run_wakes_up_on_schedule():
+    done = asyncio.Event()
+    seen = []
+
+    async def renew(sub_id, payload):
+        seen.append(sub_id)
+        done.set()
+        return None
+
+    sched = RenewScheduler(lambda: [], lambda ids: [(i, None) for i in ids], renew)
+    task = asyncio.create_task(sched.run())
+    try:
+        await asyncio.sleep(0.01)
+        sched.schedule(7, 0)
+        await asyncio.wait_for(done.wait(), timeout=1)
+        assert seen == [7]
+    finally:
+        task.cancel()